@@ -1,10 +1,22 @@
 import torch
 import torch.optim as optim
+import numpy as np
+import random
 import os
 import time
 import math
+import logging
 from torch.nn import DataParallel
 
+from logger import MetricsLogger
+from checkpoint import CheckpointWriter
+from env import Env
+from profiler import PhaseProfiler, TraceWindow
+
+log = logging.getLogger(__name__)
+# per-decode-step records, sampled by the filter installed in logger.setup_logging
+step_log = logging.getLogger(__name__ + '.step')
+
 
 def move_to(var, device):
     if isinstance(var, dict):
@@ -22,14 +34,38 @@ device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cp
 
 
 class State(object):
+    """
+    Decoder view of the env state. The env updates its tensors in place on its own device (the model's device),
+    so the state reads them from the env instead of being re-wrapped after every step, and follows Env.select.
+    """
+    __slots__ = ('env',)
+
+    def __init__(self, env):
+        self.env = env
+
+    @property
+    def batch_size(self):
+        return self.env.batch_size
+
+    @property
+    def n_nodes(self):
+        return self.env.n_nodes
+
+    @property
+    def cur_loc(self):
+        return self.env.cur_loc
 
-    def __init__(self, batch_size, n_nodes, mask, demand, cur_load):
-        self.batch_size = batch_size
-        self.n_nodes = n_nodes
-        self.demand = demand
-        self.mask = mask
-        self.cur_load = cur_load.to(device)
-        self.cur_loc = torch.full((self.batch_size, 1), self.n_nodes - 1).to(device)
+    @property
+    def cur_load(self):
+        return self.env.cur_load
+
+    @property
+    def mask(self):
+        return self.env.mask
+
+    @property
+    def demand(self):
+        return self.env.demand
 
     def __getitem__(self, item):
         return {
@@ -39,13 +75,6 @@ class State(object):
             'demand': self.demand[item]
         }
 
-    def update(self, cur_loc, mask, demand, cur_load):
-        # self.current_node = current_node[:, None]
-        self.cur_loc = cur_loc.to(device)
-        self.cur_load = cur_load.to(device)
-        self.demand = demand
-        self.mask = mask
-
 
 def clip_grad_norms(param_groups, max_norm=math.inf):
     """
@@ -67,6 +96,167 @@ def clip_grad_norms(param_groups, max_norm=math.inf):
     return grad_norms, grad_norms_clipped
 
 
+def embed_state(model, env, data, static=None):
+    """
+    Embeds the current env state. In 'full' mode the encoder is re-run on every call, in 'incremental' mode
+    the static encoding is computed once per episode (when static is None) and only the dynamic
+    node features are projected onto its cached keys.
+    :return: embeddings, fixed, static encoding to pass back in on the next step
+    """
+    data = move_to(data, device)
+    if model.encode_mode == 'full':
+        embeddings, fixed = model.embed(data)
+        return embeddings, fixed, None
+    if static is None:
+        static = model.embed_static(data)
+    embeddings, static_fixed = static
+    fixed = model.update_dynamic(static_fixed, move_to(env.dynamic_features(), device))
+    return embeddings, fixed, static
+
+
+def select_static(static, index):
+    # the static encoding of embed_state for the instances index of the batch, None in 'full' mode
+    if static is None:
+        return None
+    index = index.to(device)
+    return static[0][index], static[1][index]
+
+
+def compact(env, data, static):
+    """
+    Drops the finished instances from env (see Env.compact) and from the rollout's data and static encoding
+    :return: data, static for the remaining instances
+    """
+    keep = env.compact()
+    if keep is None:
+        return data, static
+    return data[keep], select_static(static, keep)
+
+
+@torch.no_grad()
+def greedy_rollout(model, env, data, decode_len):
+    """
+    Greedy decoding of a batch of instances, returns the reward of every instance.
+    Only the rewards are needed, so no autograd graph is built over the decode steps.
+    """
+    model.eval()
+    set_decode_type(model, "greedy")
+    data, mask, demand, cur_load = env.reset(data)
+    embeddings, fixed, static = embed_state(model, env, data)
+    state = State(env)
+
+    step_log.debug("initial state: %s", state[0])
+    time_step = 0
+
+    while time_step < decode_len:
+        log_p, idx = model(embeddings, fixed, state)
+        time_step += 1
+        step_log.debug("time step %d", time_step)
+        data, cur_loc, mask, demand, cur_load, finished = env.step(idx)
+        if finished:
+            break
+        data, static = compact(env, data, static)
+        embeddings, fixed, static = embed_state(model, env, data, static)
+
+        step_log.debug("state update: %s", state[0])
+
+    env.collect()
+    R = env.reward.to(device)
+
+    return R
+
+
+@torch.no_grad()
+def sample_rollout(model, env, data, decode_len, n_samples):
+    """
+    Draws n_samples trajectories per instance in one batched rollout and keeps the best one of each instance.
+    The encoding and the env state after reset are expanded along the batch dimension instead of re-encoding,
+    so all samples of an instance share its initial demand.
+    :return: best reward (batch_size), its actions (batch_size, n_steps) and its row in the expanded env batch
+    """
+    model.eval()
+    set_decode_type(model, "sampling")
+    batch_size = data.size(0)
+    data, mask, demand, cur_load = env.reset(data)
+    embeddings, fixed, static = embed_state(model, env, data)
+    index = torch.arange(batch_size).repeat_interleave(n_samples)
+    data, mask, demand, cur_load = env.expand(n_samples)
+    embeddings, fixed = embeddings[index.to(device)], fixed[index.to(device)]
+    static = select_static(static, index)
+    state = State(env)
+
+    actions = []
+    time_step = 0
+    while time_step < decode_len:
+        log_p, idx = model(embeddings, fixed, state)
+        actions.append(idx)
+        time_step += 1
+        data, cur_loc, mask, demand, cur_load, finished = env.step(idx)
+        if finished:
+            break
+        embeddings, fixed, static = embed_state(model, env, data, static)
+
+    # the reward counts served demands, so the best sample is the one with the highest reward
+    reward, best = env.reward.view(batch_size, n_samples).max(1)
+    best = best + torch.arange(batch_size, device=best.device) * n_samples
+    actions = torch.stack(actions, 1)[best.to(device)]
+    return reward.to(device), actions, best
+
+
+@torch.no_grad()
+def beam_search(model, env, data, decode_len, beam_width):
+    """
+    Beam search over the model's log-probabilities. The beams are rows of one batched Env; every step
+    keeps the beam_width best (beam, node) extensions by cumulative log-probability and forks the env state of
+    their parent beams with Env.select.
+    :return: reward of the best beam (batch_size), its actions (batch_size, n_steps) and its row in the env batch
+    """
+    model.eval()
+    set_decode_type(model, "beam")
+    batch_size, n_nodes = data.size(0), data.size(1)
+    data, mask, demand, cur_load = env.reset(data)
+    embeddings, fixed, static = embed_state(model, env, data)
+    index = torch.arange(batch_size).repeat_interleave(beam_width)
+    data, mask, demand, cur_load = env.expand(beam_width)
+    embeddings, fixed = embeddings[index.to(device)], fixed[index.to(device)]
+    static = select_static(static, index)
+    state = State(env)
+
+    # all beams start identical, so only the first one may be extended in the first step
+    score = torch.full((batch_size, beam_width), -math.inf, device=device)
+    score[:, 0] = 0
+    actions = torch.zeros(batch_size * beam_width, 0, dtype=torch.long, device=device)
+    offset = (torch.arange(batch_size, device=device) * beam_width)[:, None]
+    time_step = 0
+    while time_step < decode_len:
+        log_p, _ = model(embeddings, fixed, state)
+        # (batch_size, beam_width * n_nodes) cumulative log-probability of every extension
+        candidates = (score[:, :, None] + log_p.view(batch_size, beam_width, n_nodes)).view(batch_size, -1)
+        score, flat = candidates.topk(beam_width, 1)
+        parent = (offset + flat // n_nodes).view(-1)
+        node = (flat % n_nodes).view(-1)
+
+        data, mask, demand, cur_load = env.select(parent)
+        embeddings, fixed, actions = embeddings[parent], fixed[parent], actions[parent]
+        static = select_static(static, parent)
+        # instances with fewer feasible extensions than beams fill up with dead (-inf) beams,
+        # these follow their parent's most likely feasible node so the env stays valid
+        dead = torch.isinf(score).view(-1)
+        node = torch.where(dead, log_p[parent, 0].argmax(-1), node)
+
+        actions = torch.cat((actions, node[:, None]), 1)
+        time_step += 1
+        data, cur_loc, mask, demand, cur_load, finished = env.step(node)
+        if finished:
+            break
+        embeddings, fixed, static = embed_state(model, env, data, static)
+
+    # beams are sorted by score, so equal rewards are resolved in favour of the more likely beam
+    reward, best = env.reward.view(batch_size, beam_width).max(1)
+    best = best + torch.arange(batch_size, device=best.device) * beam_width
+    return reward.to(device), actions[best.to(device)], best
+
+
 class A2CAgent(object):
 
     def __init__(self, model, args, env, dataGen):
@@ -75,152 +265,197 @@ class A2CAgent(object):
         self.env = env
         self.dataGen = dataGen
         self.test_data = dataGen.get_test_all()
+        # the test set is evaluated every epoch; its chunks are kept with an env that caches their distance matrices
+        self.test_chunks = None
+        self.test_env = None
         # Initialize optimizer
         self.optimizer = optim.Adam([{'params': model.parameters(), 'lr': args['actor_net_lr']}])
         # Initialize learning rate scheduler, decay by lr_decay once per epoch!
         self.lr_scheduler = optim.lr_scheduler.LambdaLR(self.optimizer, lambda epoch: args['lr_decay'] ** epoch)
-        out_file = open(os.path.join(args['log_dir'], 'results.txt'), 'w+')
-        print("agent is initialized")
-
-    def train_epochs(self, baseline):
+        self.metrics = MetricsLogger(args['log_dir'], flush_every=args.get('metrics_flush_every', 100))
+        # checkpoints are written in the background, keeping only the last keep_checkpoints epoch files
+        self.checkpointer = CheckpointWriter(args['save_path'], args.get('keep_checkpoints', None))
+        self.best_reward = 100000
+        # per-phase times and counters of every training batch go into the metrics, see profiler.PhaseProfiler
+        self.profiler = PhaseProfiler(args.get('profile', False), device)
+        self.trace = TraceWindow(args.get('profile_trace', None), os.path.join(args['log_dir'], 'profile'))
+        log.info("agent is initialized")
+
+    def train_epochs(self, baseline, start_epoch=0, pipeline=None):
         args = self.args
         model = self.model
         test_rewards = []
-        best_model = 100000
-        losses = []
 
         start_time = time.time()
-        for epoch in range(args['n_epochs']):
-            # [n_batches, batch_size, n_nodes, 3]: entire epoch train data
-            train_data = self.dataGen.get_train_next(args['n_batch'])
-            # compute baseline value for the entire epoch
-            baseline_data = baseline.wrap_dataset(train_data)
+        for epoch in range(start_epoch, args['n_epochs']):
+            if pipeline is not None:
+                # data (and baseline values) of this epoch were generated ahead by the pipeline workers
+                baseline_data = pipeline.next_epoch(baseline)
+            else:
+                # [n_batches, batch_size, n_nodes, 3]: entire epoch train data
+                train_data = self.dataGen.get_train_next(args['n_batch'])
+                # compute baseline value for the entire epoch
+                baseline_data = baseline.wrap_dataset(train_data)
             # compute for each batch the rollout
             # train each batch
             for batch in range(args['n_batch']):
-                print("batch: ", batch)
-                print("epoch: ", epoch)
+                batch_start = time.time()
+                self.trace.step(epoch * args['n_batch'] + batch)
+                log.debug("epoch %d batch %d", epoch, batch)
                 # evaluate b_l with  new train data and old model
                 data, bl_val = baseline.unwrap_batch(baseline_data[batch])
                 bl_val = move_to(bl_val, device) if bl_val is not None else None
-                R, logs, actions = self.rollout_train(data)
-                # Calculate loss
-                adv = (R - bl_val).to(device)
-                loss = (adv * logs).mean()
-                losses.append(loss)
-                # Perform backward pass and optimization step
-                self.optimizer.zero_grad()
-                loss.backward()
-                # Clip gradient norms and get (clipped) gradient norms for logging
-                grad_norms = clip_grad_norms(self.optimizer.param_groups, args['max_grad_norm'])
-                self.optimizer.step()
+                R, logs, actions, entropy = self.rollout_train(data)
+                with self.profiler.phase('backward'):
+                    # Calculate loss
+                    adv = (R - bl_val).to(device)
+                    loss = (adv * logs).mean()
+                    if entropy is not None:
+                        loss = loss - args['entropy_weight'] * entropy.mean()
+                    # Perform backward pass and optimization step
+                    self.optimizer.zero_grad()
+                    loss.backward()
+                with self.profiler.phase('optimizer'):
+                    # Clip gradient norms and get (clipped) gradient norms for logging
+                    grad_norms, grad_norms_clipped = clip_grad_norms(self.optimizer.param_groups,
+                                                                     args['max_grad_norm'])
+                    self.optimizer.step()
+                metrics = self.profiler.summary()
+                if entropy is not None:
+                    metrics['entropy'] = entropy.mean()
+                self.metrics.log(epoch=epoch, batch=batch, reward=R.mean(), loss=loss, grad_norm=grad_norms[0],
+                                 grad_norm_clipped=grad_norms_clipped[0], step_time=time.time() - batch_start,
+                                 **metrics)
             epoch_duration = time.time() - start_time
-            print("Finished epoch {}, took {} s".format(epoch, time.strftime('%H:%M:%S', time.gmtime(epoch_duration))))
-            avg_reward = self.rollout_test(self.test_data, self.model).mean()
-            print("average test reward: ", avg_reward)
-            if (epoch % args['save_interval'] == 0) or epoch == args['n_epochs'] - 1:
-                print('Saving model and state...')
-                print(args['save_path'])
-                torch.save(
-                    {
-                        'model': self.model.state_dict(),
-                        'optimizer': self.optimizer.state_dict(),
-                        'rng_state': torch.get_rng_state(),
-                        'cuda_rng_state': torch.cuda.get_rng_state_all(),
-                        'baseline': baseline.state_dict()
-                    },
-                    os.path.join(args['save_path'], 'epoch-{}.pt'.format(epoch))
-                )
-            if avg_reward < best_model:
-                best_model = avg_reward
-                torch.save(
-                    {
-                        'model': self.model.state_dict(),
-                        'optimizer': self.optimizer.state_dict(),
-                        'rng_state': torch.get_rng_state(),
-                        'cuda_rng_state': torch.cuda.get_rng_state_all(),
-                        'baseline': baseline.state_dict()
-                    },
-                    os.path.join(args['save_path'], 'best_model.pt')
-                )
-
+            log.info("Finished epoch %d, took %s s", epoch, time.strftime('%H:%M:%S', time.gmtime(epoch_duration)))
+            avg_reward = self.evaluate(self.test_data).mean()
+            log.info("average test reward: %s", avg_reward)
+            self.metrics.log(epoch=epoch, test_reward=avg_reward, epoch_time=epoch_duration)
             baseline.epoch_callback(self.model, epoch)
+            if pipeline is not None:
+                pipeline.update_baseline(baseline)
             test_rewards.append(avg_reward)
             # np.savetxt("trained_models/test_rewards.txt", test_rewards)
-            # np.savetxt("trained_models/losses.txt", losses)
             # lr_scheduler should be called at end of epoch
             self.lr_scheduler.step()
+            # checkpoints hold the state at the end of the epoch, so a resumed run continues with epoch + 1;
+            # best_reward is updated first, so the epoch file of a new best already records it
+            is_best = avg_reward < self.best_reward
+            if is_best:
+                self.best_reward = avg_reward
+            checkpoint = self._checkpoint(baseline, epoch)
+            if (epoch % args['save_interval'] == 0) or epoch == args['n_epochs'] - 1:
+                log.info('Saving model and state to %s', args['save_path'])
+                self.checkpointer.save(checkpoint, 'epoch-{}.pt'.format(epoch), epoch_file=True)
+            if is_best:
+                self.checkpointer.save(checkpoint, 'best_model.pt')
+        self.trace.stop()
+        self.metrics.flush()
+        self.checkpointer.wait()
+
+    def _checkpoint(self, baseline, epoch):
+        return {
+            'args': self.args,
+            'epoch': epoch,
+            'best_reward': self.best_reward,
+            'model': self.model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+            'lr_scheduler': self.lr_scheduler.state_dict(),
+            'rng_state': torch.get_rng_state(),
+            'cuda_rng_state': torch.cuda.get_rng_state_all(),
+            'py_rng_state': random.getstate(),
+            'np_rng_state': np.random.get_state(),
+            'data_rng_state': self.dataGen.generator.get_state(),
+            'baseline': baseline.state_dict()
+        }
+
+    def load_checkpoint(self, path):
+        """
+        Restores model, optimizer, lr scheduler and all RNG states from a checkpoint written by train_epochs
+        :return: the checkpoint dict, its 'baseline' entry can be passed to the RolloutBaseline
+        """
+        log.info('Resuming from %s', path)
+        checkpoint = torch.load(path, map_location='cpu', weights_only=False)
+        self.model.load_state_dict(checkpoint['model'])
+        self.optimizer.load_state_dict(checkpoint['optimizer'])
+        self.lr_scheduler.load_state_dict(checkpoint['lr_scheduler'])
+        self.best_reward = checkpoint['best_reward']
+        torch.set_rng_state(checkpoint['rng_state'])
+        if torch.cuda.is_available() and len(checkpoint['cuda_rng_state']) > 0:
+            torch.cuda.set_rng_state_all(checkpoint['cuda_rng_state'])
+        random.setstate(checkpoint['py_rng_state'])
+        np.random.set_state(checkpoint['np_rng_state'])
+        self.dataGen.generator.set_state(checkpoint['data_rng_state'])
+        return checkpoint
 
     def rollout_train(self, data):
         env = self.env
         model = self.model
+        profiler = self.profiler
         model.train()
         set_decode_type(self.model, "sampling")
 
         data, mask, demand, cur_load = env.reset(data)
-        data = move_to(data, device)
-        embeddings, fixed = model.embed(data)
-        state = State(env.batch_size, env.n_nodes, mask, demand, cur_load)
-
-        # print("{}: {}".format("initial state", state[0]))
-        # print("{}: {}".format("mask", mask[0]))
-        logs = []
+        with profiler.phase('embed'):
+            embeddings, fixed, static = embed_state(model, env, data)
+        state = State(env)
+
+        step_log.debug("initial state: %s", state[0])
+        # only the log-probability of the selected node (and the entropy) is kept per step, summed per instance
+        # of the reset batch; instances dropped by env.compact would only visit the depot, with log-probability 0
+        logs = torch.zeros(env.batch_size, device=device)
+        entropy = torch.zeros(env.batch_size, device=device) if self.args.get('entropy_weight', 0) > 0 else None
         actions = []
         time_step = 0
 
         while time_step < self.args['decode_len']:
-            log_p, idx = model(embeddings, fixed, state)
-            logs.append(log_p[:, 0, :])
-            actions.append(idx)
-            time_step += 1
-            print(time_step, " time step")
-            data, cur_loc, mask, demand, cur_load, finished = env.step(idx)
-            if finished:
-                break
-            state.update(cur_loc, mask, demand, cur_load)
-            data = move_to(data, device)
-            embeddings, fixed = model.embed(data)
-
-            print("{}: {}".format("state update", state[0]))
-            print("{}: {}".format("mask", mask[0]))
-            # print("{}: {}".format("state", env.state[0]))
-
-        R = env.reward.to(device)
-        logs = torch.stack(logs, 1)
-        actions = torch.stack(actions, 1)
-
-        logs = model._calc_log_likelihood(logs, actions)
-
-        return R, logs, actions
-
-    def rollout_test(self, data, model):
-        env = self.env
-        model.eval()
-        set_decode_type(self.model, "greedy")
-        data, mask, demand, cur_load = env.reset(data)
-        data = move_to(data, device)
-        embeddings, fixed = model.embed(data)
-        state = State(env.batch_size, env.n_nodes, mask, demand, cur_load)
-
-        print("{}: {}".format("initial state", state[0]))
-        print("{}: {}".format("mask", mask[0]))
-        time_step = 0
-
-        while time_step < self.args['decode_len']:
-            log_p, idx = model(embeddings, fixed, state)
+            with profiler.phase('decode'):
+                log_p, idx = model(embeddings, fixed, state)
+            origin = env.origin.to(device)
+            logs = logs.index_add(0, origin, model._calc_log_likelihood(log_p, idx[:, None]))
+            if entropy is not None:
+                entropy = entropy.index_add(0, origin, model._calc_entropy(log_p))
+            actions.append((origin, idx))
             time_step += 1
-            print(time_step, " time step")
-            data, cur_loc, mask, demand, cur_load, finished = env.step(idx)
+            step_log.debug("time step %d", time_step)
+            with profiler.phase('env_step'):
+                data, cur_loc, mask, demand, cur_load, finished = env.step(idx)
             if finished:
                 break
-            data = move_to(data, device)
-            state.update(cur_loc, mask, demand, cur_load)
-            embeddings, fixed = model.embed(data)
-
-            print("{}: {}".format("state update", state[0]))
-            print("{}: {}".format("mask", mask[0]))
-            # print("{}: {}".format("state", env.state[0]))
-
+            if model.encode_mode == 'incremental':
+                # the full re-encoding normalizes with the batch statistics in train mode, so dropping instances
+                # would change the encoding (and log-probabilities) of the remaining ones
+                data, static = compact(env, data, static)
+            with profiler.phase('embed'):
+                embeddings, fixed, static = embed_state(model, env, data, static)
+
+            step_log.debug("state update: %s", state[0])
+
+        env.collect()
+        profiler.count('decode_steps', time_step)
+        profiler.count('events_released', env.released.sum())
         R = env.reward.to(device)
 
-        return R
+        all_actions = torch.full((R.size(0), len(actions)), env.n_nodes - 1, dtype=torch.long, device=device)
+        for t, (origin, idx) in enumerate(actions):
+            all_actions[origin, t] = idx
+
+        return R, logs, all_actions, entropy
+
+    def evaluate(self, store, model=None):
+        """
+        Greedy rewards of model (default the trained model) on an InstanceStore,
+        streamed in chunks of eval_batch_size instances
+        """
+        model = self.model if model is None else model
+        eval_batch_size = self.args.get('eval_batch_size', self.args['batch_size'])
+        if store is not self.test_data:
+            return torch.cat([self.rollout_test(data, model).cpu() for data in store.iter_chunks(eval_batch_size)])
+        if self.test_chunks is None:
+            self.test_chunks = list(store.iter_chunks(eval_batch_size))
+            self.test_env = Env(dict(self.args, batch_size=eval_batch_size, dist_cache_size=len(self.test_chunks)),
+                                device=self.env.device)
+        return torch.cat([self.rollout_test(data, model, self.test_env).cpu() for data in self.test_chunks])
+
+    def rollout_test(self, data, model, env=None):
+        return greedy_rollout(model, self.env if env is None else env, data, self.args['decode_len'])
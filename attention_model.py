@@ -4,9 +4,22 @@ import math
 from typing import NamedTuple
 from torch.nn import DataParallel
 
-from graph_encoder import GraphAttentionEncoder
+import torch.nn.functional as F
+
+from graph_encoder import GraphAttentionEncoder, MultiHeadAttention, FUSED_ATTENTION, additive_mask
 
 device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+# compute dtype used under autocast, 'fp32' runs without autocast
+PRECISIONS = {'fp32': None, 'bf16': torch.bfloat16}
+_compiled = {}
+
+
+def compiled(fn):
+    # one compiled function per method shared by all models, dynamo guards on the model it is called with.
+    # batch sizes differ between training, evaluation and beam search, so shapes are dynamic from the start
+    if fn not in _compiled:
+        _compiled[fn] = torch.compile(fn, dynamic=True)
+    return _compiled[fn]
 
 
 def set_decode_type(model, decode_type):
@@ -50,7 +63,12 @@ class AttentionModel(nn.Module):
                  normalization='batch',
                  n_heads=8,
                  checkpoint_encoder=False,
-                 shrink_size=None):
+                 shrink_size=None,
+                 encode_mode='full',
+                 validate_actions=False,
+                 fused_attention=True,
+                 precision='fp32',
+                 compile=False):
         super(AttentionModel, self).__init__()
 
         self.embedding_dim = embedding_dim
@@ -58,6 +76,9 @@ class AttentionModel(nn.Module):
         self.n_encode_layers = n_encode_layers
         self.decode_type = "sampling"
         self.temp = 1.0
+        self.set_encode_mode(encode_mode)
+        # check every selected action for feasibility (and log_p for nans), costs a host sync per step
+        self.validate_actions = validate_actions
 
         self.tanh_clipping = tanh_clipping
 
@@ -70,6 +91,7 @@ class AttentionModel(nn.Module):
 
         step_context_dim = embedding_dim + 1  # Embedding of data + demand
         node_dim = 3  # x, y, demand
+        dynamic_dim = 3  # demand, answered age, time
 
         # Learned input symbols for first action
         #      self.W_placeholder = nn.Parameter(torch.Tensor(2 * embedding_dim))
@@ -90,32 +112,74 @@ class AttentionModel(nn.Module):
         # Projects graph embedding
         self.project_fixed_context = nn.Linear(embedding_dim, embedding_dim, bias=False).to(device)
         self.project_step_context = nn.Linear(step_context_dim, embedding_dim, bias=False).to(device)
+        # Projects dynamic node features onto the cached (glimpse key, glimpse value, logit key) in incremental mode
+        self.project_node_dynamic = nn.Linear(dynamic_dim, 3 * embedding_dim, bias=False).to(device)
         self.project_dist = nn.Linear(n_nodes, embedding_dim, bias=False)
         assert embedding_dim % n_heads == 0
         # Note n_heads * val_dim == embedding_dim so input to project_out is embedding_dim
         self.project_out = nn.Linear(embedding_dim, embedding_dim, bias=False).to(device)
+        self.set_fused_attention(fused_attention)
+        self.set_precision(precision, compile)
 
     def embed(self, static):
+        if self.compile:
+            return compiled(AttentionModel._embed)(self, static)
+        return self._embed(static)
+
+    def _embed(self, static):
         # encoder
-        embeddings, _ = self.embedder(self._init_embed(static))
-        fixed = self._precompute(embeddings)
+        with self._autocast():
+            embeddings, _ = self.embedder(self._init_embed(static))
+            fixed = self._precompute(embeddings)
         return embeddings, fixed
 
+    def embed_static(self, static):
+        # encoder over the static node features only (demand zeroed), run once per episode in incremental mode
+        static = torch.cat((static[:, :, :2], torch.zeros_like(static[:, :, 2:])), -1)
+        return self.embed(static)
+
+    def update_dynamic(self, fixed, dynamic):
+        """
+        Injects the dynamic node features into the keys cached by embed_static, O(n * d) instead of re-encoding
+        :param fixed: AttentionModelFixed of the static node features
+        :param dynamic: (batch_size, graph_size, 3) scaled demand, answered age and time for each node, see
+        Env.dynamic_features
+        """
+        with self._autocast():
+            glimpse_key, glimpse_val, logit_key = self.project_node_dynamic(dynamic[:, None, :, :]).chunk(3, dim=-1)
+        return fixed._replace(
+            glimpse_key=fixed.glimpse_key + self._make_heads(glimpse_key),
+            glimpse_val=fixed.glimpse_val + self._make_heads(glimpse_val),
+            logit_key=fixed.logit_key + logit_key
+        )
+
     def forward(self, embeddings, fixed, state, return_pi=False, normalize=True):
+        if self.compile:
+            return compiled(AttentionModel._decode_step)(self, embeddings, fixed, state, normalize)
+        return self._decode_step(embeddings, fixed, state, normalize)
+
+    def _decode_step(self, embeddings, fixed, state, normalize=True):
         # [b_s, 1, emb_dim]
         # context = self._get_parallel_step_context(fixed.node_embeddings, state).view(-1, self.embedding_dim, 2)
-        query = fixed.context_node_projected + \
-                self.project_step_context(self._get_parallel_step_context(fixed.node_embeddings, state))
-
-        # Compute keys and values for the nodes
-        glimpse_K, glimpse_V, logit_K = fixed.glimpse_key, fixed.glimpse_val, fixed.logit_key
         mask = state.mask[:, None, :]
-        # Compute logits (unnormalized log_p)
-        log_p, glimpse = self._one_to_many_logits(query, glimpse_K, glimpse_V, logit_K, mask)
+        with self._autocast():
+            query = fixed.context_node_projected + \
+                    self.project_step_context(self._get_parallel_step_context(fixed.node_embeddings, state))
+
+            # Compute keys and values for the nodes
+            glimpse_K, glimpse_V, logit_K = fixed.glimpse_key, fixed.glimpse_val, fixed.logit_key
+            # Compute logits (unnormalized log_p)
+            log_p, glimpse = self._one_to_many_logits(query, glimpse_K, glimpse_V, logit_K, mask)
+        # softmax, sampling and the log likelihood stay in float32
+        log_p = log_p.float()
         if normalize:
             log_p = torch.log_softmax(log_p / self.temp, dim=-1)
-        assert not torch.isnan(log_p).any()
-        action = self._select_node(log_p.exp()[:, 0, :], mask[:, 0, :].to(device))
+        if self.validate_actions:
+            assert not torch.isnan(log_p).any(), "Log probs should not contain any nans"
+        if self.decode_type == "beam":
+            # beam search selects nodes jointly over all beams of an instance, see agent.beam_search
+            return log_p, None
+        action = self._select_node(log_p[:, 0, :], mask[:, 0, :].to(device))
         return log_p, action
 
     def _one_to_many_logits(self, query, glimpse_K, glimpse_V, logit_K, mask):
@@ -124,19 +188,22 @@ class AttentionModel(nn.Module):
         # Compute the glimpse, rearrange dimensions so the dimensions are (n_heads, batch_size, num_steps, 1, key_size)
         glimpse_Q = query.view(batch_size, num_steps, self.n_heads, 1, key_size).permute(2, 0, 1, 3, 4)
 
-        # Batch matrix multiplication to compute compatibilities (n_heads, batch_size, num_steps, graph_size)
-        compatibility = torch.matmul(glimpse_Q, glimpse_K.transpose(-2, -1)) / math.sqrt(glimpse_Q.size(-1))
         mask = mask.type(torch.bool)
-        # print(mask.size())
-        # print(mask[0],  "mask batch0")
-        # print(compatibility.size())
-        # print(compatibility[:, 0], "compatability before")
         if self.mask_inner:
             assert self.mask_logits, "Cannot mask inner without masking logits"
-            compatibility[mask[None, :, :, None, :].expand_as(compatibility)] = -math.inf
-        # print(compatibility[:, 0], "compatability after")
-        # Batch matrix multiplication to compute heads (n_heads, batch_size, num_steps, val_size)
-        heads = torch.matmul(torch.softmax(compatibility, dim=-1), glimpse_V)
+        if self.fused_attention:
+            # (n_heads, batch_size * num_steps, 1, key_size), num_steps is 1 so no copies are made
+            attn_mask = additive_mask(mask.reshape(1, -1, 1, mask.size(-1)), query.dtype) if self.mask_inner else None
+            heads = F.scaled_dot_product_attention(
+                glimpse_Q.flatten(1, 2), glimpse_K.flatten(1, 2), glimpse_V.flatten(1, 2), attn_mask=attn_mask
+            ).view(self.n_heads, batch_size, num_steps, 1, val_size)
+        else:
+            # Batch matrix multiplication to compute compatibilities (n_heads, batch_size, num_steps, graph_size)
+            compatibility = torch.matmul(glimpse_Q, glimpse_K.transpose(-2, -1)) / math.sqrt(glimpse_Q.size(-1))
+            if self.mask_inner:
+                compatibility[mask[None, :, :, None, :].expand_as(compatibility)] = -math.inf
+            # Batch matrix multiplication to compute heads (n_heads, batch_size, num_steps, val_size)
+            heads = torch.matmul(torch.softmax(compatibility, dim=-1), glimpse_V)
 
         # Project to get glimpse/updated context node embedding (batch_size, num_steps, embedding_dim)
         glimpse = self.project_out(
@@ -153,27 +220,26 @@ class AttentionModel(nn.Module):
         if self.tanh_clipping > 0:
             logits = torch.tanh(logits) * self.tanh_clipping
         if self.mask_logits:
-            logits[mask] = -math.inf
+            logits = logits.masked_fill(mask, -math.inf)
         return logits, glimpse.squeeze(-2)
 
-    def _select_node(self, probs, mask):
-        assert (probs == probs).all(), "Probs should not contain any nans"
+    def _select_node(self, log_p, mask):
+        # masked nodes have log_p = -inf, so a single draw is always feasible and no resampling is needed
+        mask = mask.type(torch.bool)
         if self.decode_type == "greedy":
-            _, selected = probs.max(1)
-            assert not mask.gather(1, selected.unsqueeze(
-                -1)).data.any(), "Decode greedy: infeasible action has maximum probability"
+            _, selected = log_p.max(1)
 
         elif self.decode_type == "sampling":
-            selected = probs.multinomial(1).squeeze(1)
-
-            # Check if sampling went OK, can go wrong due to bug on GPU
-            # See https://discuss.pytorch.org/t/bad-behavior-of-multinomial-function/10232
-            while mask.gather(1, selected.unsqueeze(-1)).data.any():
-                print('Sampled bad values, resampling!')
-                selected = probs.multinomial(1).squeeze(1)
+            # Gumbel-max trick: the argmax of log_p plus Gumbel noise is a sample of softmax(log_p)
+            gumbel = -torch.empty_like(log_p).exponential_().log()
+            _, selected = (log_p + gumbel).masked_fill(mask, -math.inf).max(1)
 
         else:
             assert False, "Unknown decode type"
+
+        if self.validate_actions:
+            # Debug only, checking the selection forces a device to host sync on every step
+            assert not mask.gather(1, selected.unsqueeze(-1)).any(), "Selected an infeasible node"
         return selected
 
     def _calc_log_likelihood(self, _log_p, a, mask=None):
@@ -185,11 +251,17 @@ class AttentionModel(nn.Module):
         if mask is not None:
             log_p[mask] = 0
 
-        assert (log_p > -1000).data.all(), "Logprobs should not be -inf, check sampling procedure!"
+        if self.validate_actions:
+            assert (log_p > -1000).data.all(), "Logprobs should not be -inf, check sampling procedure!"
 
         # Calculate log_likelihood
         return log_p.sum(1)
 
+    def _calc_entropy(self, _log_p):
+        # entropy of the node distribution of every step, summed over the steps; masked nodes (p = 0) add 0
+        entropy = -(_log_p.exp() * _log_p.masked_fill(torch.isinf(_log_p), 0)).sum(-1)
+        return entropy.sum(1)
+
     def _init_embed(self, input):
         # compute initial embedding
         return self.init_embed(input)
@@ -238,6 +310,28 @@ class AttentionModel(nn.Module):
             .permute(3, 0, 1, 2, 4)  # (n_heads, batch_size, num_steps, graph_size, head_dim)
         )
 
+    def set_encode_mode(self, encode_mode):
+        # 'full' re-runs the encoder after every step, 'incremental' encodes once and updates the cached keys
+        assert encode_mode in ('full', 'incremental'), "Unknown encode mode"
+        self.encode_mode = encode_mode
+
+    def set_fused_attention(self, fused_attention):
+        # scaled_dot_product_attention in the decoder and the encoder layers, when torch provides it
+        self.fused_attention = fused_attention and FUSED_ATTENTION
+        for module in self.modules():
+            if isinstance(module, MultiHeadAttention):
+                module.fused = self.fused_attention
+
+    def set_precision(self, precision, compile=False):
+        # autocast the encoder and decoder to a lower precision, optionally torch.compile embed and the decode step
+        assert precision in PRECISIONS, "Unknown precision"
+        self.precision = precision
+        self.compile = compile
+
+    def _autocast(self):
+        return torch.autocast(device.type, dtype=PRECISIONS[self.precision] or torch.float32,
+                              enabled=PRECISIONS[self.precision] is not None)
+
     def set_decode_type(self, decode_type, temp=None):
         self.decode_type = decode_type
         if temp is not None:  # Do not change temperature if not provided
@@ -1,21 +1,29 @@
 import copy
+import logging
 import torch
 from scipy.stats import ttest_rel
 
+from env import Env
+from agent import greedy_rollout
+from heuristics import POLICIES, heuristic_rollout
 
-def rollout(agent, model, dataset, args):
-    def eval_model_bat(bat):
-        # evaluate the model
-        cost = agent.rollout_test(bat, model)
-        return cost
+log = logging.getLogger(__name__)
 
-    bl_val = torch.zeros([args['n_batch'], args['batch_size']])
-    print("n_batch: ", args['n_batch'])
-    print("dataset: ", dataset.shape)
-    for batch in range(args['n_batch']):
-        bl_val[batch, :] = eval_model_bat(dataset[batch])
-        print("batch b_l: ", batch)
-    return bl_val
+
+def rollout(model, dataset, args, env, rollout_fn=greedy_rollout):
+    """
+    Greedy rewards of model on every instance of dataset (n_batch, batch_size, n_nodes, 5).
+    The batches are concatenated and evaluated in chunks of args['eval_batch_size'] instances,
+    independent of the training batch size. With rollout_fn=heuristic_rollout, model is a heuristic policy.
+    """
+    n_batch, batch_size = dataset.shape[:2]
+    dataset = dataset.reshape(n_batch * batch_size, *dataset.shape[2:])
+    eval_batch_size = args.get('eval_batch_size', n_batch * batch_size)
+    bl_val = torch.cat([
+        rollout_fn(model, env, bat, args['decode_len']).cpu()
+        for bat in torch.split(dataset, eval_batch_size)
+    ])
+    return bl_val.view(n_batch, batch_size)
 
 
 class BaselineDataset(object):
@@ -34,40 +42,61 @@ class BaselineDataset(object):
 
 class RolloutBaseline(object):
 
-    def __init__(self, agent, model, args, dataGen, epoch=0):
+    def __init__(self, agent, model, args, dataGen, epoch=0, state_dict=None):
         self.model = model
         self.agent = agent
         self.dataGen = dataGen
         self.args = args
-
-        self._update_model(model, epoch)
+        # own env sized to the evaluation batch, so baseline rollouts do not reset the training env
+        eval_batch_size = args.get('eval_batch_size', args['n_batch'] * args['batch_size'])
+        self.env = Env(dict(args, batch_size=eval_batch_size), device=agent.env.device)
+        self.dataset_env = None
+        # incremented whenever the baseline model is replaced
+        self.version = 0
+
+        if state_dict is not None:
+            self.load_state_dict(state_dict)
+        else:
+            self._update_model(model, epoch)
 
     def _update_model(self, model, epoch, dataset=None):
         self.model = copy.deepcopy(model)
+        self.version += 1
         # Always generate baseline dataset when updating model to prevent overfitting to the baseline dataset
 
         if dataset is not None:
             if len(dataset) != self.args['val_size']:
-                print("Warning: not using saved baseline dataset since val_size does not match")
+                log.warning("not using saved baseline dataset since val_size does not match")
                 dataset = None
         #   elif (dataset[0] if self.problem.NAME == 'tsp' else dataset[0]['loc']).size(0) != self.opts.graph_size:
         #      print("Warning: not using saved baseline dataset since graph_size does not match")
         #      dataset = None
 
         if dataset is None:
-            self.dataset = self.dataGen.get_train_next(self.args['n_batch'])
-        else:
-            self.dataset = dataset
-        print("Evaluating baseline model on evaluation dataset")
-        print("eval data: ", self.dataset.shape)
-        self.bl_vals = rollout(self.agent, self.model, self.dataset, self.args)
+            # remember where the generator was, so the dataset can be regenerated instead of saved
+            self.dataset_rng_state = self.dataGen.generator.get_state()
+            dataset = self.dataGen.get_train_next(self.args['n_batch'])
+        self._set_dataset(dataset)
+        log.info("Evaluating baseline model on evaluation dataset of shape %s", tuple(self.dataset.shape))
+        self.bl_vals = rollout(self.model, self.dataset, self.args, self.dataset_env)
         self.mean = self.bl_vals.mean()
         self.epoch = epoch
 
-    def wrap_dataset(self, dataset):
-        print("Evaluating baseline on training dataset...")
-
-        return BaselineDataset(dataset, rollout(self.agent, self.model, dataset, self.args))
+    def _set_dataset(self, dataset):
+        # the evaluation dataset is rolled out again every epoch, its env keeps the distance matrices of all its
+        # chunks; a new env drops those of the previous dataset
+        self.dataset = dataset
+        eval_batch_size = self.env.batch_size
+        n_chunks = -(-dataset.shape[0] * dataset.shape[1] // eval_batch_size)
+        self.dataset_env = Env(dict(self.args, batch_size=eval_batch_size, dist_cache_size=n_chunks),
+                               device=self.env.device)
+
+    def wrap_dataset(self, dataset, bl_vals=None):
+        # bl_vals can be passed in when they were already computed with the current baseline model
+        if bl_vals is None:
+            log.info("Evaluating baseline on training dataset...")
+            bl_vals = rollout(self.model, dataset, self.args, self.env)
+        return BaselineDataset(dataset, bl_vals)
 
     def unwrap_batch(self, batch):
         return batch['data'], batch['baseline']  # Flatten result to undo wrapping as 2D
@@ -86,13 +115,13 @@ class RolloutBaseline(object):
         :param model: The model to challenge the baseline by
         :param epoch: The current epoch
         """
-        print("Evaluating candidate model on evaluation dataset")
-        candidate_vals = rollout(self.agent, model, self.dataset, self.args)
+        log.info("Evaluating candidate model on evaluation dataset")
+        candidate_vals = rollout(model, self.dataset, self.args, self.dataset_env)
 
         candidate_mean = candidate_vals.mean()
 
-        print("Epoch {} candidate mean {}, baseline epoch {} mean {}, difference {}".format(
-            epoch, candidate_mean, self.epoch, self.mean, candidate_mean - self.mean))
+        log.info("Epoch %d candidate mean %s, baseline epoch %d mean %s, difference %s",
+                 epoch, candidate_mean, self.epoch, self.mean, candidate_mean - self.mean)
 
         if candidate_mean - self.mean < 0:
             # Calc p value
@@ -102,21 +131,63 @@ class RolloutBaseline(object):
             t, p = ttest_rel(candidate_vals, bl_vals)
             p_val = p / 2  # one-sided
             assert t < 0, "T-statistic should be negative"
-            print("p-value: {}".format(p_val))
+            log.info("p-value: %s", p_val)
             if p_val < self.args['bl_alpha']:
-                print('Update baseline')
+                log.info('Update baseline')
                 self._update_model(model, epoch)
 
     def state_dict(self):
+        # weights only, the baseline dataset is regenerated on load from the generator state it was drawn with
         return {
-            'model': self.model,
-            'dataset': self.dataset,
-            'epoch': self.epoch
+            'model': self.model.state_dict(),
+            'epoch': self.epoch,
+            'bl_vals': self.bl_vals,
+            'dataset_rng_state': self.dataset_rng_state
         }
 
     def load_state_dict(self, state_dict):
-        # We make it such that it works whether model was saved as data parallel or not
         load_model = copy.deepcopy(self.model)
-        load_model.load_state_dict(state_dict['model'].state_dict())
-        self._update_model(load_model, state_dict['epoch'], state_dict['dataset'])
+        load_model.load_state_dict(state_dict['model'])
+        if 'bl_vals' not in state_dict:
+            self._update_model(load_model, state_dict['epoch'])
+            return
+        # restore the cached baseline values instead of rolling out the baseline model again
+        generator = torch.Generator()
+        generator.set_state(state_dict['dataset_rng_state'])
+        self.model = load_model
+        self.version += 1
+        self.dataset_rng_state = state_dict['dataset_rng_state']
+        self._set_dataset(self.dataGen.get_train_next(self.args['n_batch'], generator))
+        self.bl_vals = state_dict['bl_vals']
+        self.mean = self.bl_vals.mean()
+        self.epoch = state_dict['epoch']
+
 
+class HeuristicBaseline(object):
+    """
+    Baseline values of a heuristic policy (a heuristics.POLICIES name) on the training instances, a cheap
+    alternative to RolloutBaseline: nothing is learned, so there is no baseline model to challenge or save.
+    """
+
+    def __init__(self, policy, args, device=None):
+        self.policy = POLICIES[policy]
+        self.args = args
+        eval_batch_size = args.get('eval_batch_size', args['n_batch'] * args['batch_size'])
+        self.env = Env(dict(args, batch_size=eval_batch_size), device=device)
+
+    def wrap_dataset(self, dataset, bl_vals=None):
+        if bl_vals is None:
+            bl_vals = rollout(self.policy, dataset, self.args, self.env, heuristic_rollout)
+        return BaselineDataset(dataset, bl_vals)
+
+    def unwrap_batch(self, batch):
+        return batch['data'], batch['baseline']
+
+    def epoch_callback(self, model, epoch):
+        pass
+
+    def state_dict(self):
+        return {}
+
+    def load_state_dict(self, state_dict):
+        pass
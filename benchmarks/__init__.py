@@ -0,0 +1,10 @@
+"""
+Throughput benchmarks of the env, the model and the training/evaluation rollouts, run from the repository root:
+
+    python -m benchmarks.run --n_nodes 20 50 --batch_size 128 512 --output results.json
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+
+Build and solve times of the SDVRPTW MIP (needs gurobipy):
+
+    python -m benchmarks.mip --n_customers 10 20 50 --output mip.json
+"""
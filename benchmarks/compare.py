@@ -0,0 +1,66 @@
+import sys
+import json
+import logging
+import argparse
+
+from logger import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+def load(path):
+    with open(path) as f:
+        results = json.load(f)
+    return results['environment'], {(r['case'], r['n_nodes'], r['batch_size']): r for r in results['results']}
+
+
+def compare(baseline, new, threshold):
+    """
+    Compares the median times of the benchmarks both result sets contain
+    :return: list of (key, baseline median, new median, ratio, status), status is 'regression' when the new median
+    is more than threshold (relative) slower, 'improvement' when it is that much faster, else 'ok'
+    """
+    rows = []
+    for key in sorted(set(baseline) & set(new)):
+        old_time, new_time = baseline[key]['time_median'], new[key]['time_median']
+        ratio = new_time / old_time
+        status = 'regression' if ratio > 1 + threshold else 'improvement' if ratio < 1 / (1 + threshold) else 'ok'
+        rows.append((key, old_time, new_time, ratio, status))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files written by benchmarks.run")
+    parser.add_argument('baseline')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument('--log_level', default='INFO')
+    opts = parser.parse_args()
+    setup_logging(vars(opts))
+
+    baseline_env, baseline = load(opts.baseline)
+    new_env, new = load(opts.new)
+    for name in ('platform', 'processor', 'cpu_count', 'torch_threads', 'device', 'cuda_device', 'torch'):
+        if baseline_env.get(name) != new_env.get(name):
+            log.warning("%s differs: %s vs %s", name, baseline_env.get(name), new_env.get(name))
+    missing = sorted(set(baseline) ^ set(new))
+    if missing:
+        log.warning("%d benchmarks are only in one of the files: %s", len(missing), missing)
+
+    rows = compare(baseline, new, opts.threshold)
+    for (case, n_nodes, batch_size), old_time, new_time, ratio, status in rows:
+        log.info("%-16s n_nodes %4d batch %5d: %10.3f ms -> %10.3f ms  x%.2f  %s", case, n_nodes, batch_size,
+                 old_time * 1000, new_time * 1000, ratio, status)
+    for key in sorted(set(baseline) & set(new)):
+        old_memory, new_memory = baseline[key].get('peak_memory'), new[key].get('peak_memory')
+        if old_memory and new_memory:
+            log.info("%-16s n_nodes %4d batch %5d: peak memory %8.1f MB -> %8.1f MB  x%.2f", *key,
+                     old_memory / 2 ** 20, new_memory / 2 ** 20, new_memory / old_memory)
+    regressions = [row for row in rows if row[-1] == 'regression']
+    log.info("%d benchmarks compared, %d regressions", len(rows), len(regressions))
+    # non-zero exit status so scripts can fail on regressions
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import json
+import math
+import time
+import logging
+import argparse
+import statistics
+
+import gurobipy as gp
+from gurobipy import GRB
+
+from benchmarks.run import environment
+from env import generate_instances, make_generator
+from logger import setup_logging
+from sdvrptw import SDVRPTW
+
+log = logging.getLogger(__name__)
+
+
+def instance(n_customers, max_load, seed):
+    # every node but the depot gets one demand event, so all n_customers nodes are in the model
+    args = {'batch_size': 1, 'n_nodes': n_customers + 1, 'initial_demand_size': 0, 'max_load': max_load,
+            'lambda': 1}
+    return generate_instances(args, 1, make_generator(seed))[0, 0]
+
+
+def run_size(n_customers, opts):
+    data = instance(n_customers, opts.max_load, opts.seed)
+    # enough capacity for the fleet to serve all demand
+    capacity = math.ceil(float(data[:, 4].sum()) / opts.n_vehicles)
+    build = lambda: SDVRPTW(data, opts.n_vehicles, capacity, window=opts.window, speed=opts.speed)
+    times = []
+    for _ in range(opts.repeat):
+        start = time.perf_counter()
+        problem = build()
+        problem.model.update()
+        times.append(time.perf_counter() - start)
+    result = {
+        'n_customers': n_customers,
+        'n_vehicles': opts.n_vehicles,
+        'capacity': capacity,
+        'n_vars': problem.model.NumVars,
+        'n_constrs': problem.model.NumConstrs,
+        'build_time_median': statistics.median(times),
+        'build_time_min': min(times),
+        'solve_time': None,
+        'status': None,
+        'objective': None,
+        'gap': None,
+    }
+    try:
+        start = time.perf_counter()
+        objective = problem.solve(opts.time_limit, opts.threads)
+        result['solve_time'] = time.perf_counter() - start
+    except gp.GurobiError as e:
+        # the size-limited license refuses to optimize larger models, they are only built
+        if e.errno != GRB.Error.SIZE_LIMIT_EXCEEDED:
+            raise
+        log.warning("%d customers: %s", n_customers, e)
+        result['status'] = 'size_limit_exceeded'
+        return result
+    result['status'] = problem.model.Status
+    result['objective'] = objective
+    result['gap'] = problem.model.MIPGap if objective is not None else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and solve times of the SDVRPTW MIP")
+    parser.add_argument('--n_customers', nargs='+', type=int, default=[10, 20, 50])
+    parser.add_argument('--n_vehicles', type=int, default=2)
+    parser.add_argument('--max_load', type=int, default=9, help="demands are drawn from [1, max_load)")
+    parser.add_argument('--window', type=float, default=None, help="time windows close this long after the demand "
+                                                                   "arrives, default: open until the horizon")
+    parser.add_argument('--speed', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help="timed model builds per size")
+    parser.add_argument('--time_limit', type=float, default=60., help="seconds per solve")
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', required=True, help="json file to write the results to")
+    parser.add_argument('--log_level', default='INFO')
+    opts = parser.parse_args()
+    setup_logging(vars(opts))
+
+    results = []
+    for n_customers in opts.n_customers:
+        result = run_size(n_customers, opts)
+        log.info("%3d customers: %5d vars %5d constrs, build %8.2f ms, solve %s s, status %s, objective %s",
+                 n_customers, result['n_vars'], result['n_constrs'], result['build_time_median'] * 1000,
+                 None if result['solve_time'] is None else '%.2f' % result['solve_time'], result['status'],
+                 None if result['objective'] is None else '%.4f' % result['objective'])
+        results.append(result)
+
+    environment_info = dict(environment(), gurobi='.'.join(map(str, gp.gurobi.version())))
+    os.makedirs(os.path.dirname(os.path.abspath(opts.output)), exist_ok=True)
+    with open(opts.output, 'w') as f:
+        json.dump({'environment': environment_info, 'config': vars(opts), 'results': results}, f, indent=2)
+    log.info("Wrote %d results to %s", len(results), opts.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import torch
+
+from agent import device
+from benchmarks.suite import CASES, bench_args, run_case
+from logger import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+def environment():
+    # where the numbers come from, results of different machines are not comparable
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+        'device': str(device),
+        'cuda_device': torch.cuda.get_device_name() if device.type == 'cuda' else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks over a grid of problem and batch sizes")
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--n_nodes', nargs='+', type=int, default=[20, 50, 100])
+    parser.add_argument('--batch_size', nargs='+', type=int, default=[128, 512])
+    parser.add_argument('--decode_len', type=int, default=40, help="decode steps of the rollout cases")
+    parser.add_argument('--encode_mode', default='full', choices=['full', 'incremental'],
+                        help="encode mode of the model cases, default: the one main.py trains with")
+    parser.add_argument('--repeat', type=int, default=10, help="timed calls per case and size")
+    parser.add_argument('--threads', type=int, default=None, help="torch cpu threads, default: torch's choice")
+    parser.add_argument('--output', required=True, help="json file to write the results to")
+    parser.add_argument('--log_level', default='INFO')
+    opts = parser.parse_args()
+    setup_logging(vars(opts))
+    if opts.threads is not None:
+        torch.set_num_threads(opts.threads)
+
+    results = []
+    # the rollout_train case builds an A2CAgent, which writes its test set and logs somewhere
+    with tempfile.TemporaryDirectory() as data_dir:
+        for n_nodes in opts.n_nodes:
+            for batch_size in opts.batch_size:
+                args = bench_args(n_nodes, batch_size, opts.decode_len, data_dir, opts.encode_mode)
+                for case in opts.cases:
+                    result = run_case(case, args, opts.repeat)
+                    log.info("%-16s n_nodes %4d batch %5d: %10.3f ms %12.1f instances/s", case, n_nodes, batch_size,
+                             result['time_median'] * 1000, result['instances_per_s'])
+                    results.append(result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(opts.output)), exist_ok=True)
+    with open(opts.output, 'w') as f:
+        json.dump({'environment': environment(), 'config': vars(opts), 'results': results}, f, indent=2)
+    log.info("Wrote %d results to %s", len(results), opts.output)
+
+
+if __name__ == '__main__':
+    main()
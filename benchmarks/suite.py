@@ -0,0 +1,215 @@
+import time
+import statistics
+
+import torch
+
+from agent import A2CAgent, State, embed_state, greedy_rollout, device
+from attention_model import AttentionModel
+from env import DataGenerator, Env, generate_events, generate_instances, make_generator
+from heuristics import POLICIES, heuristic_rollout
+
+
+def _sync():
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def measure(fn, repeat, warmup=1):
+    """
+    Calls fn warmup + repeat times, the device is synchronized around every timed call
+    :return: list of the repeat call times in seconds
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        _sync()
+        start = time.perf_counter()
+        fn()
+        _sync()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_args(n_nodes, batch_size, decode_len, data_dir, encode_mode='full'):
+    # problem settings of main.py, scaled to the benchmarked size
+    return {
+        'n_batch': 1,
+        'batch_size': batch_size,
+        'eval_batch_size': batch_size,
+        'test_size': 1,
+        'n_nodes': n_nodes,
+        'initial_demand_size': max(1, n_nodes // 5),
+        'max_load': 9,
+        'speed': 0.1,
+        'lambda': 1,
+        'data_dir': data_dir,
+        'log_dir': data_dir,
+        'save_path': data_dir,
+        'decode_len': decode_len,
+        'actor_net_lr': 0.001,
+        'lr_decay': 1.0,
+        'embedding_dim': 128,
+        'encode_mode': encode_mode,
+        'seed': 0,
+    }
+
+
+def _model(args):
+    return AttentionModel(args['embedding_dim'], args['embedding_dim'], args['n_nodes'],
+                          encode_mode=args['encode_mode']).to(device)
+
+
+def _data(args):
+    return generate_instances(args, 1, make_generator(args['seed']))[0]
+
+
+def env_reset(args, repeat):
+    env, data = Env(args, device=device), _data(args)
+    return measure(lambda: env.reset(data), repeat)
+
+
+def env_step(args, repeat):
+    # one call is a single step with a random feasible node, the env is reset (untimed) when all instances are done
+    env, data = Env(args, device=device), _data(args)
+    generator = make_generator(args['seed'])
+    mask = env.reset(data)[1]
+    times = []
+    for i in range(repeat + 1):
+        # drawn from the cpu generator so the actions do not depend on the device, then moved to the env's device
+        idx = torch.rand(mask.shape, generator=generator).to(env.device).masked_fill(mask.bool(), -1).argmax(1)
+        _sync()
+        start = time.perf_counter()
+        _, _, mask, _, _, finished = env.step(idx)
+        _sync()
+        if i > 0:
+            times.append(time.perf_counter() - start)
+        if finished:
+            mask = env.reset(data)[1]
+    return times
+
+
+def events(args, repeat):
+    generator = make_generator(args['seed'])
+    return measure(lambda: generate_events(args, generator=generator), repeat)
+
+
+def encoder(args, repeat):
+    model = _model(args).eval()
+    static = _data(args)[:, :, :3].to(device)
+    with torch.no_grad():
+        return measure(lambda: model.embedder(model._init_embed(static)), repeat)
+
+
+def decoder(args, repeat):
+    # a single AttentionModel.forward step from the initial state
+    model = _model(args).eval()
+    model.set_decode_type('greedy')
+    env = Env(args, device=device)
+    data = env.reset(_data(args))[0]
+    with torch.no_grad():
+        embeddings, fixed, _ = embed_state(model, env, data)
+        state = State(env)
+        return measure(lambda: model(embeddings, fixed, state), repeat)
+
+
+def rollout_train(args, repeat):
+    # sampling episode with autograd, without the backward pass
+    model = _model(args)
+    agent = A2CAgent(model, args, Env(args, device=device), DataGenerator(args))
+    data = _data(args)
+    return measure(lambda: agent.rollout_train(data), repeat)
+
+
+def train_batch(args, repeat):
+    # rollout_train and the backward pass of its loss, with the batch mean as baseline
+    model = _model(args)
+    agent = A2CAgent(model, args, Env(args, device=device), DataGenerator(args))
+    data = _data(args)
+
+    def step():
+        R, logs, actions, entropy = agent.rollout_train(data)
+        model.zero_grad()
+        ((R - R.mean()) * logs).mean().backward()
+    return measure(step, repeat)
+
+
+def rollout_test(args, repeat):
+    model = _model(args)
+    env, data = Env(args, device=device), _data(args)
+    return measure(lambda: greedy_rollout(model, env, data, args['decode_len']), repeat)
+
+
+def heuristic(policy):
+    # whole episodes of a heuristics.POLICIES policy, the reference the rollouts of the model compare against
+    def case(args, repeat):
+        env, data = Env(args, device=device), _data(args)
+        return measure(lambda: heuristic_rollout(policy, env, data, args['decode_len']), repeat)
+    return case
+
+
+# name -> function (args, repeat) -> call times, every call processes batch_size instances
+CASES = {
+    'env_reset': env_reset,
+    'env_step': env_step,
+    'generate_events': events,
+    'encoder': encoder,
+    'decoder': decoder,
+    'rollout_train': rollout_train,
+    'train_batch': train_batch,
+    'rollout_test': rollout_test,
+}
+CASES.update(('heuristic_' + name, heuristic(name)) for name in POLICIES)
+
+
+def _rss():
+    """
+    Current and peak resident set size of the process in bytes, None on systems without /proc
+    """
+    try:
+        with open('/proc/self/status') as f:
+            status = dict(line.split(':', 1) for line in f)
+    except OSError:
+        return None
+    return int(status['VmRSS'].split()[0]) * 1024, int(status['VmHWM'].split()[0]) * 1024
+
+
+def _reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM to the current RSS (linux >= 4.0)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def run_case(name, args, repeat):
+    # env.reset draws the initial demands from the global generator, seed it so episodes are the same every run
+    torch.manual_seed(args['seed'])
+    if device.type == 'cuda':
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+    # the cpu allocator keeps no statistics, the peak rss growth over the case stands in for its peak memory;
+    # glibc moves its mmap threshold as blocks are freed, which can change it by a third between identical runs,
+    # set MALLOC_MMAP_THRESHOLD_ (e.g. 131072) to compare runs
+    start_rss = _rss() if device.type == 'cpu' and _reset_peak_rss() else None
+    times = CASES[name](args, repeat)
+    median = statistics.median(times)
+    if device.type == 'cuda':
+        peak_memory = torch.cuda.max_memory_allocated()
+    elif start_rss is not None:
+        peak_memory = _rss()[1] - start_rss[0]
+    else:
+        peak_memory = None
+    return {
+        'case': name,
+        'n_nodes': args['n_nodes'],
+        'batch_size': args['batch_size'],
+        'repeat': len(times),
+        'time_median': median,
+        'time_min': min(times),
+        'time_max': max(times),
+        'instances_per_s': args['batch_size'] / median,
+        'peak_memory': peak_memory,
+    }
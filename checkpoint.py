@@ -0,0 +1,100 @@
+import os
+import re
+import queue
+import logging
+import threading
+
+import torch
+
+log = logging.getLogger(__name__)
+# name of the epoch checkpoints written by A2CAgent.train_epochs
+EPOCH_FILE = re.compile(r'^epoch-(\d+)\.pt$')
+
+
+def snapshot(obj):
+    """
+    Copy of a (nested) state dict with every tensor detached and copied to the cpu,
+    so that the training loop can keep updating the originals while it is written
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, snapshot(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    # write to a temporary file in the same directory and rename it, so path is never left half written
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter(object):
+    """
+    Writes checkpoints from a background thread.
+    save() only takes a cpu snapshot of the state and queues it, the file is written atomically by the worker.
+    Epoch checkpoints beyond the last keep_last ones are deleted, keep_last=None keeps them all.
+    """
+
+    def __init__(self, save_path, keep_last=None):
+        os.makedirs(save_path, exist_ok=True)
+        self.save_path = save_path
+        self.keep_last = keep_last
+        # epoch files of an earlier run in save_path count towards the retention, oldest epoch first
+        existing = sorted((int(match.group(1)), name) for name, match in
+                          ((name, EPOCH_FILE.match(name)) for name in os.listdir(save_path)) if match)
+        self.epoch_files = [os.path.join(save_path, name) for _, name in existing]
+        self.error = None
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, state, filename, epoch_file=False):
+        """
+        :param state: dict of state dicts / tensors to save
+        :param filename: file name inside save_path
+        :param epoch_file: whether the file counts towards the keep_last retention
+        """
+        self._check_error()
+        self.queue.put((snapshot(state), filename, epoch_file))
+
+    def wait(self):
+        # block until every queued checkpoint is on disk
+        self.queue.join()
+        self._check_error()
+
+    def _check_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError("Writing checkpoint failed") from error
+
+    def _run(self):
+        while True:
+            state, filename, epoch_file = self.queue.get()
+            try:
+                path = os.path.join(self.save_path, filename)
+                atomic_save(state, path)
+                log.debug("Saved checkpoint %s", path)
+                if epoch_file:
+                    self._retain(path)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _retain(self, path):
+        if path in self.epoch_files:
+            self.epoch_files.remove(path)
+        self.epoch_files.append(path)
+        if self.keep_last is None:
+            return
+        while len(self.epoch_files) > self.keep_last:
+            old = self.epoch_files.pop(0)
+            if os.path.exists(old):
+                os.remove(old)
@@ -0,0 +1,83 @@
+import os
+import struct
+
+import numpy as np
+import torch
+
+MAGIC = b'SDVRPDS1'
+# magic, n_instances, n_nodes, n_features, initial_demand_size, max_load, lambda, seed, dtype code
+HEADER = struct.Struct('<8sQIIIIdqB')
+HEADER_SIZE = 64
+DTYPES = {'float32': 0, 'float16': 1, 'float64': 2}
+
+
+def dataset_name(n_instances, n_nodes, initial_demand_size, max_load, _lambda, seed, dtype='float32'):
+    # every generation parameter is part of the name, so a cached file is only reused for the same parameters
+    return 'VRP-n{}-size{}-init{}-load{}-lambda{}-seed{}-{}.bin'.format(
+        n_nodes, n_instances, initial_demand_size, max_load, _lambda, seed, dtype)
+
+
+class InstanceStore(object):
+    """
+    Instances stored as a fixed header followed by a flat (n_instances, n_nodes, n_features) array.
+    The body is memory-mapped, indexing only reads the requested instance range from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            fields = HEADER.unpack(f.read(HEADER.size))
+        magic, n_instances, n_nodes, n_features, initial_demand_size, max_load, _lambda, seed, dtype = fields
+        assert magic == MAGIC, "Not an instance store: {}".format(path)
+        self.n_nodes = n_nodes
+        self.n_features = n_features
+        self.initial_demand_size = initial_demand_size
+        self.max_load = max_load
+        self._lambda = _lambda
+        self.seed = seed
+        self.dtype = {code: name for name, code in DTYPES.items()}[dtype]
+        self.data = np.memmap(path, dtype=self.dtype, mode='r', offset=HEADER_SIZE,
+                              shape=(n_instances, n_nodes, n_features))
+
+    @staticmethod
+    def create(path, n_instances, n_nodes, initial_demand_size, max_load, _lambda, seed, make_chunk,
+               dtype='float32', chunk_size=10000):
+        """
+        Writes a new store chunk by chunk, so it never has to fit in memory
+        :param make_chunk: function n -> (n, n_nodes, n_features) tensor of new instances
+        """
+        tmp_path = path + '.tmp'
+        first = make_chunk(min(chunk_size, n_instances))
+        n_features = first.size(-1)
+        with open(tmp_path, 'wb') as f:
+            header = HEADER.pack(MAGIC, n_instances, n_nodes, n_features, initial_demand_size, max_load,
+                                 _lambda, seed, DTYPES[dtype])
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+        body = np.memmap(tmp_path, dtype=dtype, mode='r+', offset=HEADER_SIZE,
+                         shape=(n_instances, n_nodes, n_features))
+        start, chunk = 0, first
+        while True:
+            body[start:start + chunk.size(0)] = chunk.numpy().astype(dtype)
+            start += chunk.size(0)
+            if start >= n_instances:
+                break
+            chunk = make_chunk(min(chunk_size, n_instances - start))
+        body.flush()
+        del body
+        os.replace(tmp_path, path)
+        return InstanceStore(path)
+
+    def matches(self, n_instances, n_nodes, initial_demand_size, max_load, _lambda, seed, dtype='float32'):
+        return (len(self), self.n_nodes, self.initial_demand_size, self.max_load, self._lambda, self.seed,
+                self.dtype) == (n_instances, n_nodes, initial_demand_size, max_load, _lambda, seed, dtype)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, item):
+        # copies the selected instances out of the map, as float32
+        return torch.from_numpy(np.array(self.data[item], dtype=np.float32))
+
+    def iter_chunks(self, chunk_size):
+        for start in range(0, len(self), chunk_size):
+            yield self[start:start + chunk_size]
@@ -1,36 +1,61 @@
 import torch
 import numpy as np
-import random
 import os
 import math
+import logging
+from collections import OrderedDict
 
+from dataset import InstanceStore, dataset_name
 
-def create_test_dataset(args):
-    batch_size = args['batch_size']
-    n_nodes = args['n_nodes']
-    data_dir = args['data_dir']
-    # build task name and datafiles
-    task_name = 'VRP-size-{}-len-{}.txt'.format(batch_size, n_nodes)
-    fname = os.path.join(data_dir, task_name)
-    print(fname)
+log = logging.getLogger(__name__)
+# seed of the test set when no args['seed'] is given
+DEFAULT_TEST_SEED = 0
+
+
+def make_generator(seed=None):
+    '''
+    torch.Generator seeded with seed, or non-deterministically when seed is None
+    '''
+    generator = torch.Generator()
+    if seed is None:
+        generator.seed()
+    else:
+        generator.manual_seed(seed)
+    return generator
+
+
+def create_test_dataset(args, generator=None):
+    '''
+    Load the test set from data_dir, or create it there when no file with the same generation parameters exists.
+    :return: memory-mapped InstanceStore of args['test_size'] (default batch_size) instances
+    '''
+    n_instances = args.get('test_size', args['batch_size'])
+    # the test set gets its own stream, seeded from the data generator so it is fixed by args['seed']; without a
+    # seed the data generator is random, the test set is then fixed by DEFAULT_TEST_SEED so its file is reused
+    if args.get('seed', None) is None:
+        seed = DEFAULT_TEST_SEED
+    else:
+        seed = int(torch.randint(2 ** 62, (1,), generator=generator))
+    params = (n_instances, args['n_nodes'], args['initial_demand_size'], args['max_load'], float(args['lambda']),
+              seed, args.get('test_dtype', 'float32'))
+    task_name = dataset_name(*params)
+    fname = os.path.join(args['data_dir'], task_name)
     # create/load data
     if os.path.exists(fname):
-        print('Loading dataset for {}...'.format(task_name))
+        log.info('Loading dataset for %s...', task_name)
+        store = InstanceStore(fname)
+        if store.matches(*params):
+            return store
+        log.warning('Dataset header of %s does not match its parameters, recreating it', fname)
 
-        data = torch.load(fname)
-        print(data)
-    else:
-        print('Creating dataset for {}...'.format(task_name))
-        # Generate a training set of size batch_size
-        input_data = torch.rand(batch_size, n_nodes, 2)
-        # fix depot (0.5, o.5)
-        input_data[:, n_nodes - 1, 0] = 0.5
-        input_data[:, n_nodes - 1, 1] = 0.5
-        time_demand = generate_events(args)
-        data = torch.cat((input_data, time_demand), -1)
-        torch.save(data, fname)
+    log.info('Creating dataset for %s...', task_name)
+    os.makedirs(args['data_dir'], exist_ok=True)
+    test_generator = make_generator(seed)
+
+    def make_chunk(n):
+        return generate_instances(dict(args, batch_size=n), 1, test_generator)[0]
 
-    return data
+    return InstanceStore.create(fname, *params[:-1], make_chunk, dtype=params[-1])
 
 
 class DataGenerator(object):
@@ -38,67 +63,89 @@ class DataGenerator(object):
         self.args = args
         self.batch_size = args['batch_size']
         self.n_nodes = args['n_nodes']
+        # all instances are drawn from this generator so that a fixed seed reproduces every epoch
+        self.generator = make_generator(args.get('seed', None))
         # create test data
-        self.test_data = create_test_dataset(args)
+        self.test_data = create_test_dataset(args, self.generator)
 
         self.reset()
 
     def reset(self):
         self.count = 0
 
-    def get_train_next(self, n_batches):
-        train_data = torch.rand(n_batches, self.batch_size, self.n_nodes, 2)
-        train_data[:, :, self.n_nodes - 1, 0] = 0.5
-        train_data[:, :, self.n_nodes - 1, 1] = 0.5
-        time_demand = torch.zeros(n_batches, self.batch_size, self.n_nodes, 3)
-        for i in range(n_batches):
-            time_demand[i] = generate_events(self.args)
-        return torch.cat((train_data, time_demand), -1)
+    def get_train_next(self, n_batches, generator=None):
+        return generate_instances(self.args, n_batches, self.generator if generator is None else generator)
 
     def get_test_next(self):
         pass
 
     def get_test_all(self):
         '''
-        Get all test problems
+        Get all test problems, as a memory-mapped InstanceStore
         '''
         return self.test_data
 
 
-def generate_events(args):
+def generate_instances(args, n_batches, generator=None):
+    '''
+    Random training instances: uniform node coordinates, depot fixed at (0.5, 0.5), and their demand events
+    :return: (n_batches, batch_size, n_nodes, 5) tensor
+    '''
+    batch_size = args['batch_size']
+    n_nodes = args['n_nodes']
+    train_data = torch.rand(n_batches, batch_size, n_nodes, 2, generator=generator)
+    train_data[:, :, n_nodes - 1, 0] = 0.5
+    train_data[:, :, n_nodes - 1, 1] = 0.5
+    time_demand = generate_events(args, (n_batches, batch_size), generator)
+    return torch.cat((train_data, time_demand), -1)
+
+
+def generate_events(args, batch_shape=None, generator=None):
+    '''
+    Generate the dynamic demand events of a batch of instances, all at once.
+    Every node except the initial-demand nodes and the depot receives exactly one event; events arrive in a
+    random node order with Exponential(lambda) inter-arrival times.
+    :param batch_shape: leading shape of the result, defaults to (batch_size,)
+    :param generator: optional torch.Generator to draw from, for reproducible data
+    :return: (*batch_shape, n_nodes, 3) tensor of [arrival time, inter-arrival time, demand] per node
+    '''
     batch_size = args['batch_size']
     _lambda = args['lambda']
     n_nodes = args['n_nodes']
     max_load = args['max_load']
     initial_demand_size = args['initial_demand_size']
 
-    time_demand = torch.zeros(batch_size, n_nodes, 3)
-    # time_demand = torch.zeros(2,10,4)
+    batch_shape = (batch_size,) if batch_shape is None else tuple(batch_shape)
+    n_events = n_nodes - initial_demand_size - 1
+    time_demand = torch.zeros(*batch_shape, n_nodes, 3)
 
-    for k in range(batch_size):
-        _arrival_time = 0
-        nodes = [i for i in range(initial_demand_size, n_nodes - 1)]
-        for i in range(n_nodes - initial_demand_size - 1):
-            # Choose random node index
-            idx = random.choice(nodes)
-            nodes.remove(idx)
+    # random arrival order of the event nodes as a batch of permutations
+    order = torch.rand(*batch_shape, n_events, generator=generator).argsort(-1) + initial_demand_size
+    inter_arrival_time = torch.empty(*batch_shape, n_events).exponential_(_lambda, generator=generator)
+    arrival_time = inter_arrival_time.cumsum(-1)
+    demand = torch.randint(1, max_load, (*batch_shape, n_events), generator=generator).float()
 
-            # Get the next probability value from Uniform(0,1)
-            p = random.random()
-            # Plug it into the inverse of the CDF of Exponential(_lamnbda)
-            _inter_arrival_time = -math.log(1.0 - p) / _lambda
+    events = torch.stack((arrival_time, inter_arrival_time, demand), -1)
+    time_demand.scatter_(-2, order[..., None].expand_as(events), events)
+    return time_demand
 
-            # Add the inter-arrival time to the running sum
-            _arrival_time = _arrival_time + _inter_arrival_time
 
-            time_demand[k][idx][0] = _arrival_time
-            time_demand[k][idx][1] = _inter_arrival_time
-            time_demand[k][idx][2] = torch.randint(1, max_load, (1, 1))
-    return time_demand
+def pairwise_distance(input_pnt, dtype=None):
+    '''
+    Euclidean distance between all node pairs in one batched operation
+    :param input_pnt: (batch_size, n_nodes, 2) node coordinates
+    :return: (batch_size, n_nodes, n_nodes) distance matrix
+    '''
+    diff = input_pnt[:, :, None, :] - input_pnt[:, None, :, :]
+    dist = (diff[..., 0] ** 2 + diff[..., 1] ** 2) ** 0.5
+    return dist if dtype is None else dist.to(dtype)
 
 
 class Env(object):
-    def __init__(self, args):
+    # per-instance results, kept for instances dropped by compact()
+    RESULTS = ('reward', 'missed', 'released', 'done', 'length')
+
+    def __init__(self, args, device=None):
 
         self.max_load = args['max_load']
         self.n_nodes = args['n_nodes']
@@ -106,110 +153,238 @@ class Env(object):
         self.speed = args['speed']
         self.initial_demand_size = args['initial_demand_size']
         self.args = args
+        # distance matrix options: device it lives on, storage dtype (e.g. torch.half) and
+        # lazy mode which never materializes the matrix and computes queried pairs on the fly
+        self.device = torch.device(device) if device is not None else torch.device("cpu")
+        self.dist_dtype = args.get('dist_dtype', None)
+        self.lazy_dist = args.get('lazy_dist', False)
+        # number of distance matrices kept for data that is reset again, e.g. a fixed evaluation set; the cache
+        # keeps the data alive, so it is off by default for envs that only see fresh training batches
+        self.dist_cache_size = args.get('dist_cache_size', 0)
+        self._dist_cache = OrderedDict()
+        # compact() drops finished instances once this fraction of the working batch is done, None never drops
+        self.compact_fraction = args.get('compact_fraction', None)
+        # steps between the host syncs that check for finished instances, in step() and compact()
+        self.sync_every = args.get('sync_every', 1)
 
     def reset(self, data):
+        # the batch may be smaller than configured, e.g. the last chunk of an evaluation set
+        self.batch_size = data.size(0)
+        # keyed on the caller's tensor, so the cache also hits when data has to be copied to the device
+        self.dist_mat = None if self.lazy_dist else self._get_dist_mat(data[:, :, :2])
+        data = data.to(self.device)
         self.input_pnt = data[:, :, :2]
-        self.time_demand = data[:, :, 2:]
-        self.dist_mat = torch.zeros(self.batch_size, self.n_nodes, self.n_nodes, dtype=torch.float)
-        for i in range(self.n_nodes):
-            for j in range(i + 1, self.n_nodes):
-                self.dist_mat[:, i, j] = ((self.input_pnt[:, i, 0] - self.input_pnt[:, j, 0]) ** 2 +
-                                          (self.input_pnt[:, i, 1] - self.input_pnt[:, j, 1]) ** 2) ** 0.5
-                self.dist_mat[:, j, i] = self.dist_mat[:, i, j]
-
-        self.cur_load = torch.full((self.batch_size, 1), self.max_load, dtype=torch.long)
-        self.cur_loc = torch.full((self.batch_size, 1), self.n_nodes - 1)
-        self.mask = torch.ones(self.batch_size, self.n_nodes, dtype=torch.long)
-
-        self.demand = torch.zeros(self.batch_size, self.n_nodes, dtype=torch.long)
-        # generate random indices for initial demand
+        # copy the events so that releasing them does not consume the caller's dataset
+        self.time_demand = data[:, :, 2:].clone()
+        # row of dist_mat that belongs to each instance, instances created by select() share their rows
+        self.dist_rows = torch.arange(self.batch_size, device=self.device)
+
+        # all state lives on self.device and is updated in place by step()
+        self.cur_load = torch.full((self.batch_size, 1), self.max_load, dtype=torch.long, device=self.device)
+        self.cur_loc = torch.full((self.batch_size, 1), self.n_nodes - 1, device=self.device)
+        self.mask = torch.ones(self.batch_size, self.n_nodes, dtype=torch.long, device=self.device)
+
+        self.demand = torch.zeros(self.batch_size, self.n_nodes, dtype=torch.long, device=self.device)
+        # initial demand on the first initial_demand_size nodes
         initial_demand_shape = (self.batch_size, self.initial_demand_size)
-        idx = (torch.arange(self.initial_demand_size)[None, :]).repeat(self.batch_size, 1)
-        x = (torch.arange(self.batch_size)[:, None]).repeat(1, self.initial_demand_size)
-        self.demand[x, idx] = torch.randint(1, self.max_load + 1, initial_demand_shape)
-
-        self.mask[x, idx] = 0
-        self.cur_time = torch.zeros(self.batch_size)
-        self.reward = torch.zeros(self.batch_size)
-        self.answered = torch.zeros(self.batch_size, self.n_nodes)
-        self.counter = 0
+        self.demand[:, :self.initial_demand_size] = torch.randint(1, self.max_load + 1, initial_demand_shape,
+                                                                  device=self.device)
+
+        self.mask[:, :self.initial_demand_size] = 0
+        self.cur_time = torch.zeros(self.batch_size, device=self.device)
+        self.reward = torch.zeros(self.batch_size, device=self.device)
+        self.answered = torch.zeros(self.batch_size, self.n_nodes, device=self.device)
+        self.counter = torch.zeros((), dtype=torch.long, device=self.device)
+        # per instance: expired demands, released events, whether the episode is over and the number of steps it took
+        self.missed = torch.zeros(self.batch_size, dtype=torch.long, device=self.device)
+        self.released = torch.zeros(self.batch_size, dtype=torch.long, device=self.device)
+        self.done = torch.zeros(self.batch_size, dtype=torch.bool, device=self.device)
+        self.length = torch.zeros(self.batch_size, dtype=torch.long, device=self.device)
+        # position in the reset batch of every working instance, and the results of instances dropped by compact()
+        self.origin = torch.arange(self.batch_size, device=self.device)
+        self._results = None
+        self.n_steps = 0
 
         data = torch.cat((self.input_pnt, self.demand[:, :, None]), -1)
 
         return data, self.mask, self.demand, self.cur_load
 
     def step(self, idx):
+        '''
+        Move every vehicle to the node idx. Nothing is copied to the host, except for the check whether all
+        instances are finished, which is only done every sync_every steps (finished is False in between).
+        '''
         idx = idx.view(-1, 1)
-        time = self.dist_mat[(torch.arange(self.batch_size))[:, None], self.cur_loc, idx] / self.speed
+        self.length += (~self.done).long()
+        time = self._distance(self.cur_loc, idx) / self.speed
         time = time.view(-1)
-        self.cur_loc = idx.to(torch.device("cpu"))
-        self.cur_load -= self.demand[(torch.arange(self.batch_size))[:, None], idx]
+        # a new tensor, not updated in place: the model keeps the previous location for backward
+        self.cur_loc = idx
+        served = self.demand.gather(1, idx)
+        self.cur_load -= served
 
         # check if demand > 0 add reward
-        batch = torch.where(self.demand[:, idx] > 0)[0]
-        self.reward[batch] += 1
-        self.demand[(torch.arange(self.batch_size))[:, None], idx] = 0
+        self.reward += (served.view(-1) > 0).to(self.reward.dtype)
+        self.demand.scatter_(1, idx, 0)
         self.cur_time += time
-        self.mask[(torch.arange(self.batch_size))[:, None], idx] = 1
 
         # update demand to zero for customers that have been unanswered for 5-time units
         self.answered += 1
-        self.counter += len(torch.where(torch.logical_and(self.answered >= 5, self.demand > 0))[0])
-        self.demand = torch.where(self.answered >= 5, 0, self.demand)
+        expired = self.answered >= 5
+        missed = torch.logical_and(expired, self.demand > 0)
+        self.missed += missed.sum(1)
+        self.counter += missed.sum()
+        self.demand.masked_fill_(expired, 0)
 
         # refill if we are in depot
-        batch = torch.where(self.cur_loc == self.n_nodes - 1)[0]
-        self.cur_load[batch] = self.max_load
+        self.cur_load.masked_fill_(self.cur_loc == self.n_nodes - 1, self.max_load)
 
         # update mask
-        self.mask = torch.where(torch.logical_and(self.cur_load >= self.demand, self.demand != 0), 0, 1)
-
-        for batch in range(self.batch_size):
-            not_occurred_yet = torch.where(self.time_demand[batch, :, 2] != 0)[0]
-            if len(not_occurred_yet) > 0:
-                for i, event in enumerate(self.time_demand[batch]):
-                    # continue if demand is zero or event is not occurred yet
-                    if event[2] == 0 or event[0] > self.cur_time[batch]:
-                        continue
-                    else:
-                        self.demand[batch, i] = event[2]
-                        self.answered[batch, i] = 0
-                        event[2] = 0
-                        # check can we deliver enough demand
-                        if self.cur_load[batch] >= event[2]:
-                            self.mask[batch, i] = 0
+        self.mask.copy_(torch.logical_or(self.cur_load < self.demand, self.demand == 0))
+
+        self._release_events()
 
         # check if cur_loc is depot and no demand didn't appear
-        waiting = torch.where(
-            torch.logical_and(torch.sum(self.mask, 1) == self.n_nodes,
-                              (self.cur_loc == self.n_nodes - 1).view(-1)))[0]
-        for batch in waiting:
-            min_diff = math.inf
-            min_idx = -1
-            for i, event in enumerate(self.time_demand[batch]):
-                # continue if demand is zero
-                if event[2] == 0:
-                    continue
-                if event[0] - self.cur_time[batch] < min_diff:
-                    min_diff = event[0] - self.cur_time[batch]
-                    min_idx = i
-            if min_idx != -1:
-                self.demand[batch, min_idx] = self.time_demand[batch, min_idx, 2]
-                self.mask[batch, min_idx] = 0
-                self.time_demand[batch, min_idx, 2] = 0
-                self.cur_time[batch] = self.cur_time[batch] + min_diff
+        waiting = torch.logical_and(torch.sum(self.mask, 1) == self.n_nodes,
+                                    (self.cur_loc == self.n_nodes - 1).view(-1))
+        self._advance_to_next_event(waiting)
 
         # check if sum of mask is equal to n_nodes open depot
-        batch = torch.where(torch.sum(self.mask, 1) == self.n_nodes)[0]
-        self.mask[batch, -1] = 0
-        finished = False
-        if torch.all(torch.logical_and(torch.sum(self.demand, 1) == 0,
-                                       torch.logical_and((self.cur_loc == self.n_nodes - 1).view(-1),
-                                                         torch.sum(self.time_demand[:, :, 2], 1) == 0))):
-            finished = True
-            # print("\nfinished!\n")
+        self.mask[:, -1].masked_fill_(torch.sum(self.mask, 1) == self.n_nodes, 0)
+        torch.logical_and(torch.sum(self.demand, 1) == 0,
+                          torch.logical_and((self.cur_loc == self.n_nodes - 1).view(-1),
+                                            torch.sum(self.time_demand[:, :, 2], 1) == 0), out=self.done)
+        self.n_steps += 1
+        finished = self.n_steps % self.sync_every == 0 and bool(torch.all(self.done))
 
         # concatenate input points with demand
         data = torch.cat((self.input_pnt, self.demand[:, :, None]), -1)
 
         return data, self.cur_loc, self.mask, self.demand, self.cur_load, finished
+
+    def select(self, index):
+        '''
+        Re-index the batch: instance i of the new batch continues from the current state of instance index[i].
+        Instances can be repeated (to fork them into samples or beams) or dropped.
+        :param index: (new_batch_size) long tensor of instance indices
+        :return: data, mask, demand, cur_load like reset
+        '''
+        index = index.to(self.device)
+        for name in ('input_pnt', 'time_demand', 'cur_load', 'cur_loc', 'mask', 'demand', 'cur_time', 'reward',
+                     'answered', 'missed', 'released', 'done', 'length', 'dist_rows', 'origin'):
+            setattr(self, name, getattr(self, name)[index])
+        self.batch_size = index.size(0)
+        data = torch.cat((self.input_pnt, self.demand[:, :, None]), -1)
+        return data, self.mask, self.demand, self.cur_load
+
+    def compact(self):
+        '''
+        Drop the finished instances from the working batch once at least compact_fraction of it is done, so they
+        are no longer stepped (and encoded and decoded by the caller). A finished instance has no demand and no
+        pending events, so its results can not change anymore; they are kept and put back by collect().
+        Only for batches in which every instance of the reset batch appears once, not after expand().
+        :return: index of the kept instances in the previous working batch, None when nothing was dropped
+        '''
+        if self.compact_fraction is None or self.n_steps % self.sync_every != 0:
+            return None
+        n_done = int(self.done.sum())
+        if n_done == 0 or n_done < self.compact_fraction * self.batch_size:
+            return None
+        if self._results is None:
+            self._results = {name: getattr(self, name).clone() for name in self.RESULTS}
+        done = self.done
+        for name in self.RESULTS:
+            self._results[name][self.origin[done]] = getattr(self, name)[done]
+        keep = torch.where(~done)[0]
+        self.select(keep)
+        return keep
+
+    def collect(self):
+        '''
+        Put the per-instance results back in the order of the reset batch after compact(): reward, missed, released,
+        done and length cover every instance again. The rest of the state keeps only the working instances.
+        '''
+        if self._results is None:
+            return
+        for name in self.RESULTS:
+            self._results[name][self.origin] = getattr(self, name)
+            setattr(self, name, self._results[name])
+        self._results = None
+
+    def expand(self, n):
+        '''
+        Repeat every instance n times, instance b becomes instances b * n ... (b + 1) * n - 1
+        '''
+        return self.select(torch.arange(self.batch_size).repeat_interleave(n))
+
+    def _get_dist_mat(self, input_pnt):
+        '''
+        Return the distance matrix of input_pnt, reusing the cached one when the same coordinates are reset again.
+        Cached inputs are kept referenced, so a matching (data_ptr, shape, stride, version) means identical data.
+        '''
+        key = (input_pnt.data_ptr(), input_pnt.shape, input_pnt.stride(), input_pnt._version)
+        if key in self._dist_cache:
+            self._dist_cache.move_to_end(key)
+            return self._dist_cache[key][1]
+        dist_mat = pairwise_distance(input_pnt.to(self.device), self.dist_dtype)
+        if self.dist_cache_size > 0:
+            self._dist_cache[key] = (input_pnt, dist_mat)
+            if len(self._dist_cache) > self.dist_cache_size:
+                self._dist_cache.popitem(last=False)
+        return dist_mat
+
+    def _distance(self, src, dst):
+        '''
+        Distance between node src[b] and node dst[b] for every instance, as float
+        :param src: (batch_size, 1) node index
+        :param dst: (batch_size, 1) node index
+        '''
+        if self.dist_mat is None:
+            batch = torch.arange(self.batch_size, device=self.device)[:, None]
+            pnt = self.input_pnt
+            diff = pnt[batch, src] - pnt[batch, dst]
+            return (diff[..., 0] ** 2 + diff[..., 1] ** 2) ** 0.5
+        return self.dist_mat[self.dist_rows[:, None], src, dst].float()
+
+    def _release_events(self):
+        '''
+        Reveal every pending event whose arrival time has passed, for the whole batch at once.
+        Released events are cleared from time_demand so they are only revealed once.
+        '''
+        event_demand = self.time_demand[:, :, 2]
+        released = torch.logical_and(event_demand != 0, self.time_demand[:, :, 0] <= self.cur_time[:, None])
+        self.demand.copy_(torch.where(released, event_demand.to(self.demand.dtype), self.demand))
+        self.answered.masked_fill_(released, 0)
+        self.released += released.sum(1)
+        # the event demand is cleared before the load check, so a released node is always opened
+        self.mask.masked_fill_(torch.logical_and(released, self.cur_load >= 0), 0)
+        event_demand.masked_fill_(released, 0)
+
+    def _advance_to_next_event(self, waiting):
+        '''
+        Jump idle vehicles (waiting at the depot with nothing to serve) forward to their next event.
+        :param waiting: bool tensor (batch_size) of instances that have no feasible node
+        '''
+        event_demand = self.time_demand[:, :, 2]
+        pending = event_demand != 0
+        diff = torch.where(pending, self.time_demand[:, :, 0] - self.cur_time[:, None], math.inf)
+        min_diff, min_idx = diff.min(1)
+        jump = torch.logical_and(waiting, pending.any(1))
+        # one-hot of the next event node of every jumping instance, masks instead of indices avoid a host sync
+        node = torch.zeros_like(pending).scatter_(1, min_idx[:, None], jump[:, None])
+        self.demand.copy_(torch.where(node, event_demand.to(self.demand.dtype), self.demand))
+        self.mask.masked_fill_(node, 0)
+        self.released += node.sum(1)
+        event_demand.masked_fill_(node, 0)
+        self.cur_time += torch.where(jump, min_diff, 0.)
+
+    def dynamic_features(self):
+        '''
+        Per-node features that change during an episode, scaled to [0, 1] so their projection does not saturate
+        the tanh clipping of the logits: demand / max_load, steps since the demand appeared (demands expire after 5)
+        and time as a fraction of the last event's arrival time
+        :return: (batch_size, n_nodes, 3) float tensor
+        '''
+        horizon = self.time_demand[:, :, 0].max(1)[0].clamp(min=1e-6)
+        cur_time = (self.cur_time / horizon).clamp(max=1)[:, None].expand(-1, self.n_nodes)
+        return torch.stack((self.demand.float() / self.max_load, self.answered.clamp(max=5) / 5, cur_time), -1)
@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import argparse
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from agent import greedy_rollout, sample_rollout, beam_search, device
+from attention_model import AttentionModel
+from dataset import InstanceStore
+from env import Env
+from logger import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+def load_model(checkpoint):
+    # the model is built with the settings it was trained with
+    args = checkpoint['args']
+    model = AttentionModel(args['embedding_dim'], args['embedding_dim'], args['n_nodes'],
+                           encode_mode=args.get('encode_mode', 'full'),
+                           fused_attention=args.get('fused_attention', True),
+                           precision=args.get('precision', 'fp32'), compile=args.get('compile', False))
+    model.load_state_dict(checkpoint['model'])
+    return model
+
+
+def shard_seed(seed, start):
+    # independent, well mixed seed for the shard starting at instance start
+    return int(np.random.SeedSequence([seed, start]).generate_state(1)[0])
+
+
+def evaluate_range(model, env, store, start, end, args):
+    """
+    Decoding of the instances [start, end) of store in batches of args['eval_batch_size']: greedy, beam search
+    with args['beam_width'] > 1 or the best of args['n_samples'] > 1 samples per instance.
+    The initial demands drawn by Env.reset and the samples come from the global generator, which is seeded from
+    args['seed'] and start, so results do not depend on which process evaluates the range.
+    :return: list of (index, reward, missed, length) per instance
+    """
+    seed = args.get('seed')
+    torch.manual_seed(shard_seed(0 if seed is None else seed, start))
+    shard = store[start:end]
+    rows = []
+    for batch_start in range(0, shard.size(0), args['eval_batch_size']):
+        data = shard[batch_start:batch_start + args['eval_batch_size']]
+        if args.get('beam_width', 1) > 1:
+            reward, _, best = beam_search(model, env, data, args['decode_len'], args['beam_width'])
+            missed, length = env.missed[best], env.length[best]
+        elif args.get('n_samples', 1) > 1:
+            reward, _, best = sample_rollout(model, env, data, args['decode_len'], args['n_samples'])
+            missed, length = env.missed[best], env.length[best]
+        else:
+            reward = greedy_rollout(model, env, data, args['decode_len'])
+            missed, length = env.missed, env.length
+        rows.extend(zip(range(start + batch_start, start + batch_start + data.size(0)),
+                        reward.tolist(), missed.tolist(), length.tolist()))
+    return rows
+
+
+_worker_state = {}
+
+
+def _init_worker(model, path, args, n_threads):
+    torch.set_num_threads(n_threads)
+    _worker_state['model'] = model
+    _worker_state['store'] = InstanceStore(path)
+    _worker_state['env'] = Env(dict(args, batch_size=args['eval_batch_size']))
+    _worker_state['args'] = args
+
+
+def _evaluate_shard(shard):
+    return evaluate_range(_worker_state['model'], _worker_state['env'], _worker_state['store'], *shard,
+                          _worker_state['args'])
+
+
+def evaluate_store(model, store, args, out, start=0, end=None, shard_size=10000, workers=1):
+    """
+    Decoding (see evaluate_range) of the instances [start, end) of store, read from disk one shard at a time.
+    With workers > 1 the shards are spread over a pool of cpu processes that share the model weights and
+    each hold their own Env; results are written to out in instance order, one csv line per instance.
+    :return: number of instances evaluated
+    """
+    end = len(store) if end is None else min(end, len(store))
+    shards = [(s, min(s + shard_size, end)) for s in range(start, end, shard_size)]
+    if workers > 1 and device.type == 'cuda':
+        log.warning("parallel evaluation only runs on cpu, using a single process")
+        workers = 1
+
+    pool = None
+    if workers > 1:
+        model.share_memory()
+        n_threads = max(1, torch.get_num_threads() // workers)
+        pool = mp.get_context('fork').Pool(workers, initializer=_init_worker,
+                                           initargs=(model, store.path, args, n_threads))
+        results = pool.imap(_evaluate_shard, shards)
+    else:
+        env = Env(dict(args, batch_size=args['eval_batch_size']), device=device)
+        results = (evaluate_range(model, env, store, s, e, args) for s, e in shards)
+
+    start_time = time.time()
+    n = 0
+    try:
+        for rows in results:
+            for row in rows:
+                out.write('{},{},{},{}\n'.format(*row))
+            out.flush()
+            n += len(rows)
+            log.info("instances %d-%d: %.1f instances/s", start, start + n, n / (time.time() - start_time))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation of a saved model on an instance file")
+    parser.add_argument('--checkpoint', required=True, help="checkpoint written by A2CAgent.train_epochs")
+    parser.add_argument('--data', required=True, help="instance file created by create_test_dataset")
+    parser.add_argument('--output', required=True, help="csv file: index,reward,missed,length per instance")
+    parser.add_argument('--eval_batch_size', type=int, default=256)
+    parser.add_argument('--shard_size', type=int, default=10000, help="instances read from disk at once")
+    parser.add_argument('--start', type=int, default=0, help="first instance to evaluate")
+    parser.add_argument('--end', type=int, default=None, help="instance to stop at (exclusive)")
+    parser.add_argument('--samples', type=int, default=1, help="keep the best of this many samples per instance")
+    parser.add_argument('--beam_width', type=int, default=1, help="beam search with this many beams")
+    parser.add_argument('--workers', type=int, default=1, help="cpu processes to spread the shards over")
+    parser.add_argument('--decode_len', type=int, default=None, help="default: the value used in training")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the initial demands and samples, "
+                                                               "default: the training seed")
+    parser.add_argument('--log_level', default='INFO')
+    opts = parser.parse_args()
+
+    checkpoint = torch.load(opts.checkpoint, map_location=device, weights_only=False)
+    store = InstanceStore(opts.data)
+    # the instance file decides the problem size, the checkpoint the model and env settings
+    args = dict(checkpoint['args'], n_nodes=store.n_nodes, max_load=store.max_load,
+                initial_demand_size=store.initial_demand_size, eval_batch_size=opts.eval_batch_size,
+                n_samples=opts.samples, beam_width=opts.beam_width, log_level=opts.log_level)
+    if opts.decode_len is not None:
+        args['decode_len'] = opts.decode_len
+    if opts.seed is not None:
+        args['seed'] = opts.seed
+    setup_logging(args)
+    model = load_model(checkpoint)
+
+    start_time = time.time()
+    os.makedirs(os.path.dirname(os.path.abspath(opts.output)), exist_ok=True)
+    with open(opts.output, 'w') as out:
+        out.write('index,reward,missed,length\n')
+        n = evaluate_store(model, store, args, out, opts.start, opts.end, opts.shard_size, opts.workers)
+    duration = time.time() - start_time
+    log.info("Evaluated %d instances in %.1f s, %.1f instances/s", n, duration, n / duration)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
 import torch
 import numpy as np
 from torch import nn
+import torch.nn.functional as F
 import math
 
 device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+# fused attention kernel of torch >= 2.0, the explicit matmul/softmax path is used without it
+FUSED_ATTENTION = hasattr(F, 'scaled_dot_product_attention')
+
+
+def additive_mask(mask, dtype):
+    # 0 where attention is possible, -inf where mask is set
+    return torch.zeros(mask.size(), dtype=dtype, device=mask.device).masked_fill(mask, -math.inf)
+
+
 class SkipConnection(nn.Module):
 
     def __init__(self, module):
@@ -21,7 +31,8 @@ class MultiHeadAttention(nn.Module):
             input_dim,
             embed_dim,
             val_dim=None,
-            key_dim=None
+            key_dim=None,
+            fused=None
     ):
         super(MultiHeadAttention, self).__init__()
 
@@ -35,6 +46,8 @@ class MultiHeadAttention(nn.Module):
         self.embed_dim = embed_dim
         self.val_dim = val_dim
         self.key_dim = key_dim
+        # scaled_dot_product_attention scales by 1 / sqrt(key_dim) itself
+        self.fused = FUSED_ATTENTION if fused is None else fused and FUSED_ATTENTION
 
         self.norm_factor = 1 / math.sqrt(key_dim)  # See Attention is all you need
 
@@ -84,23 +97,10 @@ class MultiHeadAttention(nn.Module):
         K = torch.matmul(hflat, self.W_key).view(shp)
         V = torch.matmul(hflat, self.W_val).view(shp)
 
-        # Calculate compatibility (n_heads, batch_size, n_query, graph_size)
-        compatibility = self.norm_factor * torch.matmul(Q, K.transpose(2, 3))
-
-        # Optionally apply mask to prevent attention
-        if mask is not None:
-            mask = mask.view(1, batch_size, n_query, graph_size).expand_as(compatibility)
-            compatibility[mask] = -np.inf
-
-        attn = torch.softmax(compatibility, dim=-1)
-
-        # If there are nodes with no neighbours then softmax returns nan so we fix them to 0
-        if mask is not None:
-            attnc = attn.clone()
-            attnc[mask] = 0
-            attn = attnc
-
-        heads = torch.matmul(attn, V)
+        if self.fused:
+            heads = self._fused_heads(Q, K, V, mask, batch_size, n_query, graph_size)
+        else:
+            heads = self._heads(Q, K, V, mask, batch_size, n_query, graph_size)
 
         out = torch.mm(
             heads.permute(1, 2, 0, 3).contiguous().view(-1, self.n_heads * self.val_dim),
@@ -118,6 +118,33 @@ class MultiHeadAttention(nn.Module):
 
         return out
 
+    def _fused_heads(self, Q, K, V, mask, batch_size, n_query, graph_size):
+        if mask is None:
+            return F.scaled_dot_product_attention(Q, K, V)
+        mask = mask.view(1, batch_size, n_query, graph_size).type(torch.bool)
+        heads = F.scaled_dot_product_attention(Q, K, V, attn_mask=additive_mask(mask, Q.dtype))
+        # queries without any neighbour get 0 instead of nan, as in _heads
+        return heads.masked_fill(mask.all(-1, keepdim=True), 0)
+
+    def _heads(self, Q, K, V, mask, batch_size, n_query, graph_size):
+        # Calculate compatibility (n_heads, batch_size, n_query, graph_size)
+        compatibility = self.norm_factor * torch.matmul(Q, K.transpose(2, 3))
+
+        # Optionally apply mask to prevent attention
+        if mask is not None:
+            mask = mask.view(1, batch_size, n_query, graph_size).expand_as(compatibility)
+            compatibility[mask] = -np.inf
+
+        attn = torch.softmax(compatibility, dim=-1)
+
+        # If there are nodes with no neighbours then softmax returns nan so we fix them to 0
+        if mask is not None:
+            attnc = attn.clone()
+            attnc[mask] = 0
+            attn = attnc
+
+        return torch.matmul(attn, V)
+
 
 class Normalization(nn.Module):
 
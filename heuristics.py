@@ -0,0 +1,59 @@
+import torch
+
+
+def distances_from(env, node):
+    """
+    Distance from node[b] to every node of instance b
+    :param node: (batch_size, 1) node index
+    :return: (batch_size, n_nodes) float tensor
+    """
+    pnt = env.input_pnt
+    src = pnt.gather(1, node[:, :, None].expand(-1, -1, pnt.size(-1)))
+    return (pnt - src).norm(dim=-1)
+
+
+def nearest(env):
+    # closest feasible node
+    score = -distances_from(env, env.cur_loc)
+    return score.masked_fill(env.mask.bool(), -torch.inf).argmax(1)
+
+
+def earliest(env):
+    # the feasible demand that has waited longest (it expires first), ties broken by distance
+    dist = distances_from(env, env.cur_loc)
+    score = env.answered - dist / (dist.max(1, keepdim=True)[0] + 1)
+    return score.masked_fill(env.mask.bool(), -torch.inf).argmax(1)
+
+
+def capacity(env):
+    # most demand served per unit of distance among the demands that fit the remaining load;
+    # the depot (demand 0) is only chosen when it is the only feasible node
+    dist = distances_from(env, env.cur_loc)
+    score = env.demand.float() / (dist + 1e-6)
+    return score.masked_fill(env.mask.bool(), -torch.inf).argmax(1)
+
+
+POLICIES = {
+    'nearest': nearest,
+    'earliest': earliest,
+    'capacity': capacity,
+}
+
+
+@torch.no_grad()
+def heuristic_rollout(policy, env, data, decode_len):
+    """
+    Runs a heuristic policy (function env -> (batch_size) node index, see POLICIES) on a batch of instances,
+    like agent.greedy_rollout does for the model
+    :return: reward of every instance
+    """
+    if isinstance(policy, str):
+        policy = POLICIES[policy]
+    env.reset(data)
+    for _ in range(decode_len):
+        finished = env.step(policy(env))[-1]
+        if finished:
+            break
+        env.compact()
+    env.collect()
+    return env.reward
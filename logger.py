@@ -0,0 +1,77 @@
+import os
+import json
+import logging
+
+import torch
+
+
+def setup_logging(args):
+    """
+    Configures the loggers from the args dict
+    'log_level': level of the root logger, e.g. 'INFO' or 'DEBUG'
+    'log_step_every': only one in this many per-decode-step records (logger 'agent.step') is emitted
+    """
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        root.addHandler(handler)
+    root.setLevel(getattr(logging, str(args.get('log_level', 'INFO')).upper()))
+
+    step_logger = logging.getLogger('agent.step')
+    for f in [f for f in step_logger.filters if isinstance(f, SampleFilter)]:
+        step_logger.removeFilter(f)
+    step_logger.addFilter(SampleFilter(args.get('log_step_every', 1)))
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through one in every n records, counted separately for each message format string.
+    Tensors passed as logging arguments are only formatted for the records that get through.
+    """
+
+    def __init__(self, every=1):
+        super(SampleFilter, self).__init__()
+        self.every = max(int(every), 1)
+        self.counts = {}
+
+    def filter(self, record):
+        count = self.counts.get(record.msg, 0)
+        self.counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+def _to_python(value):
+    if torch.is_tensor(value):
+        return value.item() if value.numel() == 1 else value.tolist()
+    return value
+
+
+class MetricsLogger(object):
+    """
+    Buffered JSONL sink for training metrics, one JSON object per log() call.
+    Tensor values are kept (detached) in the buffer and only converted when it is flushed,
+    so logging does not force a device synchronization on every batch.
+    """
+
+    def __init__(self, log_dir, filename='metrics.jsonl', flush_every=100):
+        os.makedirs(log_dir, exist_ok=True)
+        self.path = os.path.join(log_dir, filename)
+        self.flush_every = flush_every
+        self.buffer = []
+
+    def log(self, **metrics):
+        self.buffer.append({k: v.detach() if torch.is_tensor(v) else v for k, v in metrics.items()})
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        with open(self.path, 'a') as f:
+            for record in self.buffer:
+                f.write(json.dumps({k: _to_python(v) for k, v in record.items()}) + '\n')
+        self.buffer = []
+
+    def close(self):
+        self.flush()
@@ -1,12 +1,16 @@
-from agent import A2CAgent
+from agent import A2CAgent, device
 from attention_model import AttentionModel
 from env import DataGenerator, Env
-from baseline import RolloutBaseline as Baseline
+from baseline import HeuristicBaseline, RolloutBaseline as Baseline
+from logger import setup_logging
+from pipeline import DataPipeline
 
 args = {
     'n_epochs': 10,
     'n_batch': 2,
     'batch_size': 4,
+    'eval_batch_size': 8,
+    'test_size': 4,
     'n_nodes': 4,
     'initial_demand_size': 2,
     'max_load': 9,
@@ -16,18 +20,57 @@ args = {
     'log_dir': 'logs',
     'save_path': 'saved_models',
     'decode_len': 20,
+    'compact_fraction': 0.25,  # drop finished instances from a rollout once this fraction of the batch is done
+    'sync_every': 1,  # decode steps between the host syncs that check whether the episodes are finished
     'actor_net_lr': 0.001,
     'lr_decay': 1.0,
     'max_grad_norm': 1.0,
+    'entropy_weight': 0.,  # weight of the entropy bonus in the loss, 0 does not compute the entropy
     'save_interval': 1,
+    'keep_checkpoints': 3,
+    'resume': None,  # path of an epoch checkpoint to continue training from
+    'data_workers': 2,  # processes generating training data ahead of the trainer, 0 to generate inline
+    'data_queue_size': 2,
+    'baseline': 'rollout',  # or a heuristics.POLICIES name ('nearest', 'earliest', 'capacity')
+    'data_baseline': True,  # let the data workers also compute the baseline values
     'bl_alpha': 0.05,
     'embedding_dim': 128,
+    'encode_mode': 'full',  # 'incremental' encodes the static features once per episode
+    'validate_actions': False,  # debug: assert every decoded action is feasible
+    'fused_attention': True,  # torch's scaled_dot_product_attention where available
+    'precision': 'fp32',  # 'bf16' runs the encoder and decoder under autocast
+    'compile': False,  # torch.compile the encoder and the decode step
+    'seed': 1234,
+    'log_level': 'INFO',
+    'log_step_every': 10,
+    'metrics_flush_every': 100,
+    'profile': False,  # time encode, decode, env step, backward and optimizer step of every batch into the metrics
+    'profile_trace': None,  # (first, last + 1) global batch to record a torch.profiler trace for, in log_dir/profile
 
 }
+setup_logging(args)
 data_generator = DataGenerator(args)
-data = data_generator.get_test_all()
-env = Env(args)
-model = AttentionModel(args['embedding_dim'], args['embedding_dim'], args['n_nodes'])
+env = Env(args, device=device)
+model = AttentionModel(args['embedding_dim'], args['embedding_dim'], args['n_nodes'],
+                       encode_mode=args['encode_mode'], validate_actions=args['validate_actions'],
+                       fused_attention=args['fused_attention'], precision=args['precision'],
+                       compile=args['compile'])
 agent = A2CAgent(model, args, env, data_generator)
-baseline = Baseline(agent, agent.model, args, data_generator)
-agent.train_epochs(baseline)
+start_epoch = 0
+if args['resume'] is not None:
+    checkpoint = agent.load_checkpoint(args['resume'])
+    start_epoch = checkpoint['epoch'] + 1
+if args['baseline'] != 'rollout':
+    baseline = HeuristicBaseline(args['baseline'], args, device=device)
+elif args['resume'] is not None:
+    baseline = Baseline(agent, agent.model, args, data_generator, state_dict=checkpoint['baseline'])
+else:
+    baseline = Baseline(agent, agent.model, args, data_generator)
+pipeline = None
+if args['data_workers'] > 0:
+    # the heuristic baseline is computed by the trainer, it has no model for the workers to roll out
+    data_baseline = args['data_baseline'] and args['baseline'] == 'rollout'
+    pipeline = DataPipeline(args, data_generator, baseline if data_baseline else None, start_epoch)
+agent.train_epochs(baseline, start_epoch, pipeline)
+if pipeline is not None:
+    pipeline.close()
@@ -0,0 +1,115 @@
+import copy
+import queue
+import logging
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from env import Env, generate_instances, make_generator
+from baseline import rollout
+from checkpoint import snapshot
+
+log = logging.getLogger(__name__)
+
+
+def epoch_seed(base_seed, epoch, stream=0):
+    # independent, well mixed seed for every epoch; stream 0 generates the data, stream 1 the baseline rollout
+    return int(np.random.SeedSequence([base_seed, epoch] + ([stream] if stream else [])).generate_state(1)[0])
+
+
+def _worker(args, worker_id, n_workers, base_seed, start_epoch, out_queue, model_queue, model, version):
+    torch.set_num_threads(1)
+    if model is not None:
+        eval_batch_size = args.get('eval_batch_size', args['n_batch'] * args['batch_size'])
+        env = Env(dict(args, batch_size=eval_batch_size))
+    # the first epoch from start_epoch on that belongs to this worker, epoch e is produced by worker e % n_workers
+    epoch = start_epoch + (worker_id - start_epoch) % n_workers
+    while True:
+        data = generate_instances(args, args['n_batch'], make_generator(epoch_seed(base_seed, epoch)))
+        bl_vals = None
+        if model is not None:
+            # switch to the newest baseline weights sent by the trainer
+            try:
+                while True:
+                    state_dict, version = model_queue.get_nowait()
+                    model.load_state_dict(state_dict)
+            except queue.Empty:
+                pass
+            # Env.reset draws the initial demands from the global generator, seeded per epoch so the values do not
+            # depend on the state the worker was forked with
+            torch.manual_seed(epoch_seed(base_seed, epoch, 1))
+            bl_vals = rollout(model, data, args, env)
+        out_queue.put((epoch, data, bl_vals, version))
+        epoch += n_workers
+
+
+class DataPipeline(object):
+    """
+    Generates the training data of upcoming epochs in worker processes, ahead of the trainer.
+    Epoch e is produced by worker e % n_workers from its own seed, so the data does not depend on the
+    number of workers or on timing. Each worker keeps at most 'data_queue_size' epochs ready.
+    When a baseline is given the workers also roll out a cpu copy of the baseline model; values computed
+    with an outdated baseline model are recomputed by the trainer, from the same per-epoch seed and without
+    touching the trainer's generator, so the values do not depend on which side computed them.
+    """
+
+    def __init__(self, args, dataGen, baseline=None, start_epoch=0):
+        self.n_workers = args.get('data_workers', 1)
+        self.epoch = start_epoch
+        # the seed is only drawn from the data generator when no seed is set, so resumed runs see the same data
+        base_seed = args.get('seed', None)
+        if base_seed is None:
+            base_seed = int(torch.randint(2 ** 31 - 1, (1,), generator=dataGen.generator))
+        self.base_seed = base_seed
+
+        model = None
+        self.version = None
+        if baseline is not None:
+            if torch.cuda.is_available():
+                log.warning("baseline values are not precomputed by the data workers when running on cuda")
+            else:
+                model = copy.deepcopy(baseline.model)
+                self.version = baseline.version
+
+        # forked, so that main.py does not have to be importable without side effects
+        context = mp.get_context('fork')
+        queue_size = args.get('data_queue_size', 2)
+        self.queues = [context.Queue(queue_size) for _ in range(self.n_workers)]
+        self.model_queues = [context.Queue() for _ in range(self.n_workers)] if model is not None else None
+        self.workers = [
+            context.Process(target=_worker, daemon=True, args=(
+                args, i, self.n_workers, base_seed, start_epoch, self.queues[i],
+                self.model_queues[i] if model is not None else None, model, self.version))
+            for i in range(self.n_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def next_epoch(self, baseline):
+        """
+        :return: BaselineDataset with the data of the next epoch and its baseline values
+        """
+        epoch, data, bl_vals, version = self.queues[self.epoch % self.n_workers].get()
+        assert epoch == self.epoch, "Data pipeline is out of order"
+        self.epoch += 1
+        if bl_vals is not None and version == baseline.version:
+            return baseline.wrap_dataset(data, bl_vals)
+        with torch.random.fork_rng():
+            torch.manual_seed(epoch_seed(self.base_seed, epoch, 1))
+            return baseline.wrap_dataset(data)
+
+    def update_baseline(self, baseline):
+        # send the weights to the workers when the baseline model was replaced
+        if self.model_queues is None or baseline.version == self.version:
+            return
+        self.version = baseline.version
+        state_dict = snapshot(baseline.model.state_dict())
+        for model_queue in self.model_queues:
+            model_queue.put((state_dict, self.version))
+
+    def close(self):
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,92 @@
+import os
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+
+import torch
+
+log = logging.getLogger(__name__)
+
+
+class PhaseProfiler(object):
+    """
+    Wall time per named phase of a training batch (encode, decode, env step, backward, optimizer step) and
+    counters, summed until summary() is called. The device is synchronized at the start and end of every phase,
+    so asynchronous kernels are attributed to the phase that launched them. Disabled, phase() and count() are
+    no-ops and nothing is synchronized.
+    """
+
+    def __init__(self, enabled=False, device=None):
+        self.enabled = enabled
+        self.cuda = device is not None and torch.device(device).type == 'cuda'
+        self.times = {}
+        self.counts = {}
+
+    def _sync(self):
+        if self.cuda:
+            torch.cuda.synchronize()
+
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name):
+        self._sync()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            self.times[name] = self.times.get(name, 0.) + time.perf_counter() - start
+
+    def count(self, name, value=1):
+        # value may be a tensor, it is only converted when the metrics are flushed
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self):
+        """
+        :return: dict of 'time_<phase>' and 'count_<counter>' since the last call, empty when disabled
+        """
+        summary = {'time_' + name: value for name, value in self.times.items()}
+        summary.update(('count_' + name, value) for name, value in self.counts.items())
+        self.times = {}
+        self.counts = {}
+        return summary
+
+
+class TraceWindow(object):
+    """
+    Records a torch.profiler trace over the global training batches [start, end) and writes it as a chrome trace
+    to log_dir. Without a batch range it does nothing.
+    """
+
+    def __init__(self, batches, log_dir):
+        self.start, self.end = batches if batches is not None else (None, None)
+        self.log_dir = log_dir
+        self.profile = None
+
+    def step(self, batch):
+        # called before global batch number batch is trained
+        if self.start is None:
+            return
+        if batch == self.start:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profile = torch.profiler.profile(activities=activities, record_shapes=True)
+            self.profile.__enter__()
+        elif batch == self.end:
+            self.stop()
+
+    def stop(self):
+        if self.profile is None:
+            return
+        self.profile.__exit__(None, None, None)
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, 'trace-batches{}-{}.json'.format(self.start, self.end))
+        self.profile.export_chrome_trace(path)
+        log.info("Wrote profiler trace to %s", path)
+        self.profile = None
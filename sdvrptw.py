@@ -0,0 +1,126 @@
+import logging
+
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gp
+from gurobipy import GRB
+
+from env import pairwise_distance
+
+log = logging.getLogger(__name__)
+
+
+class SDVRPTW(object):
+    """
+    Split delivery VRP with time windows as a MIP, for a single instance in the layout of env.generate_instances:
+    (n_nodes, 5) rows of [x, y, arrival time, inter-arrival time, demand] with the depot as the last node.
+    Nodes without demand are left out. All variables and constraints are created with the matrix API:
+
+        x[k, i, j]  binary, vehicle k drives from node i to node j
+        q[k, j]     load vehicle k delivers to customer j, a customer can be served by several vehicles
+        t[k, i]     time vehicle k starts serving node i (leaves the depot, for the depot)
+
+    The delivered load is linked to the visits by q[k, j] <= min(demand[j], capacity) * (visits of k to j), a big-M
+    bound instead of a product of the load and the arc variables. Time windows open at the arrival time of the
+    demand and stay open for window time units (until every route can have ended when window is None). The time
+    constraints use a big-M per arc and also eliminate subtours.
+    """
+
+    def __init__(self, instance, n_vehicles, capacity, demand=None, window=None, service_time=0., speed=1.,
+                 name='SDVRPTW'):
+        """
+        :param instance: (n_nodes, 5) tensor or array
+        :param demand: (n_nodes) demand to use instead of the demand column, e.g. Env.demand after reset
+        :param speed: distance per time unit, travel times are distance / speed
+        """
+        instance = np.asarray(instance, dtype=np.float64)
+        demand = instance[:, 4] if demand is None else np.asarray(demand, dtype=np.float64)
+        depot = instance.shape[0] - 1
+        # customers first, the depot last as in the env
+        self.nodes = np.append(np.nonzero(demand[:depot] > 0)[0], depot)
+        self.n_customers = n = len(self.nodes) - 1
+        self.n_vehicles = K = n_vehicles
+        self.capacity = capacity
+        self.demand = demand[self.nodes[:n]]
+
+        pnt = instance[self.nodes, :2]
+        self.dist = pairwise_distance(pnt[None])[0]
+        travel = self.dist / speed
+        service = np.full(n + 1, float(service_time))
+        service[n] = 0.
+        ready = np.append(instance[self.nodes[:n], 2], 0.)
+        # no route takes longer than visiting every node after the last demand arrived, with the longest arcs
+        horizon = ready.max() + (service + travel.max(1)).sum()
+        due = np.full(n + 1, horizon) if window is None else np.append(ready[:n] + window, horizon)
+        self.ready, self.due = ready, due
+
+        self.model = model = gp.Model(name)
+        model.Params.OutputFlag = 0
+        arcs = np.broadcast_to(1 - np.eye(n + 1), (K, n + 1, n + 1))
+        self.x = x = model.addMVar((K, n + 1, n + 1), vtype=GRB.BINARY, ub=arcs, name='x')
+        max_delivery = np.minimum(self.demand, capacity)
+        self.q = q = model.addMVar((K, n), ub=np.broadcast_to(max_delivery, (K, n)), name='q')
+        self.t = t = model.addMVar((K, n + 1), lb=np.broadcast_to(ready, (K, n + 1)),
+                                   ub=np.broadcast_to(due, (K, n + 1)), name='t')
+        # linear terms as coefficient matrix @ MVar, elementwise MLinExpr arithmetic is much slower to build
+        model.setObjective(np.tile(self.dist.ravel(), K) @ x.reshape(-1), GRB.MINIMIZE)
+
+        # every vehicle leaves the depot at most once and leaves every node it enters
+        model.addConstr(x.sum(2) == x.sum(1), name='flow')
+        model.addConstr(x[:, n, :].sum(1) <= 1, name='depot')
+        # a vehicle visits a customer at most once, and only delivers where it visits
+        visits = x[:, :, :n].sum(1)
+        model.addConstr(visits <= 1, name='visit')
+        model.addConstr(q <= max_delivery * visits, name='delivery')
+        model.addConstr(q.sum(0) == self.demand, name='demand')
+        model.addConstr(q.sum(1) <= capacity, name='capacity')
+
+        # t[k, j] - t[k, i] + big_m * (1 - x[k, i, j]) >= service[i] + travel[i, j], for every arc into a customer,
+        # one row per vehicle and arc
+        src, dst = np.nonzero(1 - np.eye(n + 1)[:, :n])
+        arc_time = service[src] + travel[src, dst]
+        big_m = np.maximum(due[src] + arc_time - ready[dst], 0.)
+        rows = np.arange(K * len(src))
+        vehicle = rows // len(src)
+        src, dst = np.tile(src, K), np.tile(dst, K)
+        shape = (len(rows), K * (n + 1))
+        time_coef = (sp.csr_matrix((np.ones(len(rows)), (rows, vehicle * (n + 1) + dst)), shape) -
+                     sp.csr_matrix((np.ones(len(rows)), (rows, vehicle * (n + 1) + src)), shape))
+        arc_coef = sp.csr_matrix((-np.tile(big_m, K), (rows, (vehicle * (n + 1) + src) * (n + 1) + dst)),
+                                 (len(rows), x.size))
+        model.addConstr(time_coef @ t.reshape(-1) + arc_coef @ x.reshape(-1) >= np.tile(arc_time - big_m, K),
+                        name='time')
+
+    def solve(self, time_limit=None, threads=None):
+        """
+        :return: objective value (total distance), None when no solution was found
+        """
+        if time_limit is not None:
+            self.model.Params.TimeLimit = time_limit
+        if threads is not None:
+            self.model.Params.Threads = threads
+        self.model.optimize()
+        if self.model.SolCount == 0:
+            log.warning("No solution found, status %d", self.model.Status)
+            return None
+        return self.model.ObjVal
+
+    def routes(self):
+        """
+        Routes of the best solution, as env node indices
+        :return: list with, for every vehicle that leaves the depot, a list of (node, delivered load) from the first
+        customer to the last
+        """
+        n = self.n_customers
+        succ = self.x.X.argmax(2)
+        used = self.x.X.max(2) > 0.5
+        routes = []
+        for k in range(self.n_vehicles):
+            route = []
+            i = n
+            while used[k, i] and succ[k, i] != n:
+                i = succ[k, i]
+                route.append((int(self.nodes[i]), float(self.q.X[k, i])))
+            if route:
+                routes.append(route)
+        return routes
@@ -0,0 +1,63 @@
+import pytest
+import torch
+
+from agent import State, device, embed_state
+from attention_model import AttentionModel
+from env import Env, generate_instances, make_generator
+from graph_encoder import FUSED_ATTENTION, MultiHeadAttention
+
+pytestmark = pytest.mark.skipif(not FUSED_ATTENTION, reason="torch has no scaled_dot_product_attention")
+
+
+def test_fused_encoder_attention_matches_explicit():
+    torch.manual_seed(0)
+    attention = MultiHeadAttention(8, input_dim=32, embed_dim=32).to(device)
+    batch_size, n_query, graph_size = 4, 5, 6
+    q = torch.randn(batch_size, n_query, 32, device=device)
+    h = torch.randn(batch_size, graph_size, 32, device=device)
+    mask = torch.rand(batch_size, n_query, graph_size, device=device) < 0.3
+    # a query without any neighbour gets 0 on both paths instead of nan
+    mask[1, 2] = True
+
+    results = []
+    for fused in (True, False):
+        attention.fused = fused
+        q_in, h_in = q.clone().requires_grad_(), h.clone().requires_grad_()
+        out = attention(q_in, h_in, mask)
+        out.sum().backward()
+        results.append((out.detach(), q_in.grad, h_in.grad))
+
+    (out, q_grad, h_grad), (ref_out, ref_q_grad, ref_h_grad) = results
+    assert torch.all(out[1, 2] == 0)
+    torch.testing.assert_close(out, ref_out, rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(q_grad, ref_q_grad, rtol=1e-5, atol=1e-5)
+    torch.testing.assert_close(h_grad, ref_h_grad, rtol=1e-5, atol=1e-5)
+
+
+def test_fused_decoder_step_matches_explicit():
+    args = {'batch_size': 16, 'n_nodes': 10, 'initial_demand_size': 2, 'max_load': 9, 'speed': 0.1, 'lambda': 1}
+    data = generate_instances(args, 1, make_generator(0))[0]
+    torch.manual_seed(0)
+    model = AttentionModel(64, 64, args['n_nodes']).to(device).eval()
+    model.set_decode_type('greedy')
+    env = Env(args, device=device)
+    data = env.reset(data)[0]
+    # a few random feasible steps, so that the masks differ between instances
+    generator = make_generator(0)
+    for _ in range(3):
+        idx = torch.rand(env.mask.shape, generator=generator).masked_fill(env.mask.bool().cpu(), -1).argmax(1)
+        data = env.step(idx.to(device))[0]
+
+    results = []
+    with torch.no_grad():
+        for fused in (True, False):
+            model.set_fused_attention(fused)
+            embeddings, fixed, _ = embed_state(model, env, data)
+            results.append(model(embeddings, fixed, State(env)))
+
+    (log_p, action), (ref_log_p, ref_action) = results
+    assert torch.equal(torch.isinf(log_p), torch.isinf(ref_log_p))
+    finite = ~torch.isinf(ref_log_p)
+    # the logits are scaled by the tanh clipping of 10, float32 rounding differs accordingly
+    torch.testing.assert_close(log_p[finite], ref_log_p[finite], rtol=1e-4, atol=1e-4)
+    assert torch.equal(action, ref_action)
@@ -0,0 +1,120 @@
+import math
+
+import pytest
+import torch
+
+from env import Env, generate_instances, make_generator
+
+
+class LoopEnv(object):
+    '''
+    Env.reset and Env.step as they were before event release and idle-wait were vectorized, kept as the reference
+    for the vectorized version. The reward is left out, it was later fixed to count per instance.
+    '''
+
+    def __init__(self, args):
+        self.max_load = args['max_load']
+        self.n_nodes = args['n_nodes']
+        self.batch_size = args['batch_size']
+        self.speed = args['speed']
+        self.initial_demand_size = args['initial_demand_size']
+
+    def reset(self, data):
+        self.input_pnt = data[:, :, :2]
+        self.time_demand = data[:, :, 2:].clone()
+        self.dist_mat = torch.zeros(self.batch_size, self.n_nodes, self.n_nodes, dtype=torch.float)
+        for i in range(self.n_nodes):
+            for j in range(i + 1, self.n_nodes):
+                self.dist_mat[:, i, j] = ((self.input_pnt[:, i, 0] - self.input_pnt[:, j, 0]) ** 2 +
+                                          (self.input_pnt[:, i, 1] - self.input_pnt[:, j, 1]) ** 2) ** 0.5
+                self.dist_mat[:, j, i] = self.dist_mat[:, i, j]
+
+        self.cur_load = torch.full((self.batch_size, 1), self.max_load, dtype=torch.long)
+        self.cur_loc = torch.full((self.batch_size, 1), self.n_nodes - 1)
+        self.mask = torch.ones(self.batch_size, self.n_nodes, dtype=torch.long)
+        self.demand = torch.zeros(self.batch_size, self.n_nodes, dtype=torch.long)
+        initial_demand_shape = (self.batch_size, self.initial_demand_size)
+        self.demand[:, :self.initial_demand_size] = torch.randint(1, self.max_load + 1, initial_demand_shape)
+        self.mask[:, :self.initial_demand_size] = 0
+        self.cur_time = torch.zeros(self.batch_size)
+        self.answered = torch.zeros(self.batch_size, self.n_nodes)
+        self.counter = 0
+
+    def step(self, idx):
+        idx = idx.view(-1, 1)
+        rows = torch.arange(self.batch_size)[:, None]
+        time = self.dist_mat[rows, self.cur_loc, idx] / self.speed
+        self.cur_loc = idx
+        self.cur_load -= self.demand[rows, idx]
+        self.demand[rows, idx] = 0
+        self.cur_time += time.view(-1)
+
+        self.answered += 1
+        self.counter += len(torch.where(torch.logical_and(self.answered >= 5, self.demand > 0))[0])
+        self.demand = torch.where(self.answered >= 5, 0, self.demand)
+
+        batch = torch.where(self.cur_loc == self.n_nodes - 1)[0]
+        self.cur_load[batch] = self.max_load
+        self.mask = torch.where(torch.logical_and(self.cur_load >= self.demand, self.demand != 0), 0, 1)
+
+        for batch in range(self.batch_size):
+            for i, event in enumerate(self.time_demand[batch]):
+                if event[2] == 0 or event[0] > self.cur_time[batch]:
+                    continue
+                self.demand[batch, i] = event[2]
+                self.answered[batch, i] = 0
+                event[2] = 0
+                if self.cur_load[batch] >= event[2]:
+                    self.mask[batch, i] = 0
+
+        waiting = torch.where(torch.logical_and(torch.sum(self.mask, 1) == self.n_nodes,
+                                                (self.cur_loc == self.n_nodes - 1).view(-1)))[0]
+        for batch in waiting:
+            min_diff = math.inf
+            min_idx = -1
+            for i, event in enumerate(self.time_demand[batch]):
+                if event[2] == 0:
+                    continue
+                if event[0] - self.cur_time[batch] < min_diff:
+                    min_diff = event[0] - self.cur_time[batch]
+                    min_idx = i
+            if min_idx != -1:
+                self.demand[batch, min_idx] = self.time_demand[batch, min_idx, 2]
+                self.mask[batch, min_idx] = 0
+                self.time_demand[batch, min_idx, 2] = 0
+                self.cur_time[batch] = self.cur_time[batch] + min_diff
+
+        batch = torch.where(torch.sum(self.mask, 1) == self.n_nodes)[0]
+        self.mask[batch, -1] = 0
+
+
+def make_args(batch_size, n_nodes, speed=0.1, _lambda=1):
+    return {'batch_size': batch_size, 'n_nodes': n_nodes, 'initial_demand_size': max(1, n_nodes // 5),
+            'max_load': 9, 'speed': speed, 'lambda': _lambda}
+
+
+# fast vehicles and rare events make the vehicles wait at the depot for the next event
+@pytest.mark.parametrize('batch_size, n_nodes, seed, speed, _lambda',
+                         [(1, 5, 0, 0.1, 1), (16, 10, 1, 0.1, 1), (32, 20, 2, 0.1, 1), (16, 20, 3, 100, 0.05)])
+def test_step_matches_loop_reference(batch_size, n_nodes, seed, speed, _lambda):
+    args = make_args(batch_size, n_nodes, speed, _lambda)
+    data = generate_instances(args, 1, make_generator(seed))[0]
+    env, reference = Env(args), LoopEnv(args)
+    # both draw the initial demands from the global generator
+    torch.manual_seed(seed)
+    mask = env.reset(data)[1]
+    torch.manual_seed(seed)
+    reference.reset(data)
+
+    pending = (reference.time_demand[:, :, 2] != 0).sum(1)
+    generator = make_generator(seed)
+    for _ in range(60):
+        idx = torch.rand(mask.shape, generator=generator).masked_fill(mask.bool(), -1).argmax(1)
+        _, _, mask, demand, cur_load, _ = env.step(idx)
+        reference.step(idx)
+        assert torch.equal(mask.long(), reference.mask)
+        assert torch.equal(demand, reference.demand)
+        assert torch.equal(cur_load, reference.cur_load)
+        assert torch.equal(env.cur_time, reference.cur_time)
+        assert int(env.counter) == reference.counter
+        assert torch.equal(env.released, pending - (reference.time_demand[:, :, 2] != 0).sum(1))